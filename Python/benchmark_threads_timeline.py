@@ -0,0 +1,322 @@
+# File 				: benchmark_threads_timeline.py
+# Brief				: This script measures the time spent by each stage of plot_threads_timeline.py
+#					  on synthetic captures : parsing of the Shell answers, loading and saving
+#					  of the files and drawing of the timeline (without window)
+#					  The captures are generated with the same text the mcu prints with the
+#					  threads_list and threads_timestamps commands
+#
+#					  To run the script : "python3 benchmark_threads_timeline.py"
+#					  Add "--switches 100000 --threads 20" to choose the size of the capture
+#					  The results are written in benchmark_results.json (see --output)
+
+import matplotlib
+# No window, the drawing is done in memory
+matplotlib.use('Agg')
+
+import plot_threads_timeline as ptt
+import threads_timestamps as tt
+import numpy as np
+import contextlib
+import tempfile
+import platform
+import subprocess
+import argparse
+import random
+import json
+import time
+import sys
+import io
+import os
+
+DEFAULT_NB_THREADS 			= 10
+DEFAULT_NB_SWITCHES 		= 20000
+DEFAULT_SAME_TICK_DENSITY 	= 0.4 # probability for a context switch to happen in the same tick as the previous one
+DEFAULT_TRIGGER_POS 		= 0.5 # position of the trigger in the capture (0 to 1)
+DEFAULT_NB_EXITED_THREADS 	= 2
+DEFAULT_LOGGED_RATIO 		= 0.7 # probability for a thread to be logged
+DEFAULT_NB_REPEATS 			= 3
+DEFAULT_OUTPUT 				= 'benchmark_results.json'
+SIMULATOR_WARMUP_MARGIN 	= 0.2 # seconds waited in addition to the time needed to fill the logs of the simulated mcu
+
+MAX_TICKS_BETWEEN_SWITCHES 	= 5
+RANGE_MAX_NB_CHECKS 		= 1000 # random ranges of the capture where the table of the auto zoom is checked
+# ChibiOS priorities
+IDLE_PRIO 		= 1
+NORMAL_PRIO 	= 128
+MAX_PRIO 		= 255
+
+# Code measured in a new interpreter for the time needed to start the script
+STARTUP_STAGES = [	('startup import numpy', 'import numpy'),
+					('startup import threads_timestamps', 'import threads_timestamps'),
+					('startup import plot_threads_timeline', 'import plot_threads_timeline'),
+					('startup create_figure', 'import matplotlib; matplotlib.use("Agg"); import plot_threads_timeline as ptt; ptt.create_figure()')]
+STARTUP_MEASURE = 'import time; start = time.perf_counter(); {}; print(time.perf_counter() - start)'
+
+def thread_line(nb, thread):
+	return 'Thread number %2d : Prio = %3d, Log = %3s, Name = %s' % (nb, thread['prio'], thread['log'], thread['name'])
+
+def timestamp_line(thread_out, thread_in, tick):
+	# The mcu only prints the lower bits of the system time
+	return 'From %2d to %2d at %7d' % (thread_out, thread_in, tick % tt.TIMESTAMPS_TIME_LOOP)
+
+def generate_capture_lines(nb_threads = DEFAULT_NB_THREADS, nb_switches = DEFAULT_NB_SWITCHES,
+							same_tick_density = DEFAULT_SAME_TICK_DENSITY, trigger_pos = DEFAULT_TRIGGER_POS,
+							nb_exited = DEFAULT_NB_EXITED_THREADS, seed = 0):
+	# Returns the lines of the threads_list and threads_timestamps answers of a random capture
+	# trigger_pos can be None to have a capture without trigger
+	# The last nb_exited threads are dynamic threads which exit during the capture
+	rand = random.Random(seed)
+
+	nb_threads = max(nb_threads, nb_exited + 2)
+
+	# The list of the mcu : main, idle then the threads created
+	threads = [{'name': 'main', 'prio': NORMAL_PRIO, 'log': 'Yes'}, {'name': 'idle', 'prio': IDLE_PRIO, 'log': 'Yes'}]
+	for i in range(2, nb_threads):
+		log = 'Yes' if rand.random() < DEFAULT_LOGGED_RATIO else 'No'
+		threads.append({'name': 'Thread {}'.format(i), 'prio': rand.randint(IDLE_PRIO + 1, MAX_PRIO), 'log': log})
+	for thread in threads[nb_threads - nb_exited:]:
+		thread['dynamic'] = True
+
+	# Context switches at which the dynamic threads exit
+	exits = sorted(rand.sample(range(nb_switches // 4, max(nb_switches, nb_switches // 4 + nb_exited)), nb_exited))
+
+	alive = list(threads)
+	deleted = []
+	lines_data = []
+	current = alive[0]
+	tick = rand.randint(0, tt.TIMESTAMPS_TIME_LOOP - 1)
+	trigger = None
+
+	for i in range(nb_switches):
+		if(rand.random() >= same_tick_density):
+			tick += rand.randint(1, MAX_TICKS_BETWEEN_SWITCHES)
+
+		if(trigger_pos != None and trigger == None and i >= nb_switches * trigger_pos):
+			trigger = tick
+
+		if(len(exits) and i >= exits[0] and current.get('dynamic', False)):
+			exits.pop(0)
+			# The exit is logged by the thread itself, then the next switch comes from a thread not in the list
+			nb = alive.index(current) + 1
+			lines_data.append(timestamp_line(nb, nb, tick))
+			deleted.append((nb, {'name': tt.EXITED_DYNAMIC_THREAD_NAME, 'prio': current['prio'], 'log': current['log']}))
+			alive.remove(current)
+			next_thread = rand.choice(alive)
+			if(current['log'] == 'Yes' or next_thread['log'] == 'Yes'):
+				lines_data.append(timestamp_line(0, alive.index(next_thread) + 1, tick))
+			current = next_thread
+			continue
+
+		next_thread = rand.choice(alive)
+		while(next_thread is current):
+			next_thread = rand.choice(alive)
+		# A switch is only recorded if one of the threads is logged
+		if(current['log'] == 'Yes' or next_thread['log'] == 'Yes'):
+			lines_data.append(timestamp_line(alive.index(current) + 1, alive.index(next_thread) + 1, tick))
+		current = next_thread
+
+	lines_list = ['threads_list']
+	lines_list += [thread_line(nb + 1, thread) for nb, thread in enumerate(alive)]
+	lines_list.append('Deleted threads: ')
+	lines_list += [thread_line(nb, thread) for nb, thread in deleted]
+	lines_list.append('ch> ')
+
+	header = ['threads_timestamps']
+	if(trigger != None):
+		header.append('Triggered at %7d' % (trigger % tt.TIMESTAMPS_TIME_LOOP))
+	lines_data = header + lines_data + ['ch> ']
+
+	return lines_list, lines_data
+
+def measure(function, nb_repeats):
+	# Returns the durations of each call of function and its last result
+	# What the function prints is not shown
+	durations = []
+	result = None
+	for i in range(nb_repeats):
+		with contextlib.redirect_stdout(io.StringIO()):
+			start = time.perf_counter()
+			result = function()
+			durations.append(time.perf_counter() - start)
+	return durations, result
+
+def summarize(durations):
+	return {'min': min(durations), 'mean': sum(durations) / len(durations), 'runs': durations}
+
+def draw_capture_file(file_path):
+	ptt.read_new_timestamps(ptt.READ_FROM_FILE, file_path)
+	ptt.fig.canvas.draw()
+
+def check_range_max(records, nb_checks, seed = 0):
+	# Compares the maximum number of steps given by the table of the auto zoom with the one of the records,
+	# on ranges found with tt.get_records_range() like the auto zoom does (its indexes are numpy integers)
+	rand = random.Random(seed)
+	table = tt.build_range_max_table(records[tt.REC_NB_OF_STEPS])
+	first_time = int(records[tt.REC_TIME][0])
+	last_time = int(records[tt.REC_TIME][-1])
+	for i in range(nb_checks):
+		begin = rand.uniform(first_time, last_time)
+		end = begin + rand.uniform(0, last_time - begin)
+		first, last = tt.get_records_range(records, begin, end)
+		expected = int(records[tt.REC_NB_OF_STEPS][first:last].max()) if first < last else None
+		if(tt.query_range_max(table, first, last) != expected):
+			return tt.FUNC_FAILED
+	return tt.FUNC_SUCCESS
+
+def run_benchmark(lines_list, lines_data, nb_repeats, folder):
+	results = {}
+
+	durations, result = measure(lambda: tt.process_threads_list_cmd(lines_list, []), nb_repeats)
+	results['process_threads_list_cmd'] = summarize(durations)
+
+	# The threads list is modified by process_threads_timestamps_cmd(), so a new one is given each time
+	def process_timestamps():
+		thread_list = []
+		tt.process_threads_list_cmd(lines_list, thread_list)
+		return tt.process_threads_timestamps_cmd(lines_data, thread_list)
+	durations, result = measure(process_timestamps, nb_repeats)
+	if(result[2] == tt.FUNC_FAILED):
+		print('The generated capture is not valid')
+		return None
+	results['process_threads_timestamps_cmd'] = summarize(durations)
+	results['nb_records'] = len(result[1])
+
+	if(check_range_max(result[1], RANGE_MAX_NB_CHECKS) == tt.FUNC_FAILED):
+		print('The range maximum table doesn\'t give the maximum of the records')
+		return None
+
+	# Draws the capture once to save it with its default position in the graph
+	ptt.create_figure()
+	txt_path = os.path.join(folder, 'capture' + tt.CAPTURE_TXT_EXTENSION)
+	with contextlib.redirect_stdout(io.StringIO()):
+		ptt.show_capture(tt.build_capture(lines_list, lines_data))
+		ptt.write_timestamps_to_file(txt_path)
+
+	for extension in (tt.CAPTURE_TXT_EXTENSION, tt.CAPTURE_TXT_GZ_EXTENSION, tt.CAPTURE_BINARY_EXTENSION):
+		file_path = os.path.join(folder, 'capture' + extension)
+		if(not os.path.exists(file_path)):
+			with contextlib.redirect_stdout(io.StringIO()):
+				tt.convert_capture_file(txt_path, file_path)
+		name = extension.lstrip('.')
+
+		durations, capture = measure(lambda: ptt.load_timestamps_from_file(file_path), nb_repeats)
+		results['load_timestamps_from_file ' + name] = summarize(durations)
+		results['file_size ' + name] = os.path.getsize(file_path)
+
+		# Same file opened again, taken from the cache of the processed captures
+		tt.capture_cache_dir = os.path.join(folder, 'cache')
+		with contextlib.redirect_stdout(io.StringIO()):
+			ptt.load_timestamps_from_file(file_path)
+		durations, capture = measure(lambda: ptt.load_timestamps_from_file(file_path), nb_repeats)
+		results['load_timestamps_from_file cached ' + name] = summarize(durations)
+		tt.capture_cache_dir = None
+
+		durations, result = measure(lambda: draw_capture_file(file_path), nb_repeats)
+		results['read_new_timestamps draw ' + name] = summarize(durations)
+
+		# Saves the capture drawn (from the file just loaded) in another file
+		saved_path = os.path.join(folder, 'saved' + extension)
+		durations, result = measure(lambda: ptt.write_timestamps_to_file(saved_path), nb_repeats)
+		results['write_timestamps_to_file ' + name] = summarize(durations)
+
+	return results
+
+def run_startup_benchmark(nb_repeats):
+	# Each stage is measured in a new interpreter, as when the script is started
+	# (the files are in the cache of the system after the first run)
+	results = {}
+	folder = os.path.dirname(os.path.abspath(__file__))
+	for stage, code in STARTUP_STAGES:
+		durations = []
+		for i in range(nb_repeats):
+			output = subprocess.run([sys.executable, '-c', STARTUP_MEASURE.format(code)], cwd=folder,
+									stdout=subprocess.PIPE, check=True).stdout
+			durations.append(float(output.split()[-1]))
+		results[stage] = summarize(durations)
+	return results
+
+def run_acquisition_benchmark(nb_threads, baudrate, nb_devices, nb_repeats):
+	# Measures the acquisitions through the serial with the simulated Shell of simulate_threads_shell.py
+	# (one simulated mcu per device, read at the same time)
+	# Imported here because the simulator only works where pseudo-terminals exist
+	import simulate_threads_shell as sim
+
+	results = {}
+	tt.devices = []
+	for i in range(nb_devices):
+		mcu = sim.new_mcu(nb_threads)
+		port_name, shell = sim.open_simulator(mcu, baudrate)
+		tt.devices.append(tt.new_device(port_name))
+	# Waits for the logs of the mcus to be full
+	time.sleep(len(mcu['log']) / mcu['switch_rate'] + SIMULATOR_WARMUP_MARGIN)
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		result = tt.connect_serial()
+	if(result == tt.FUNC_FAILED):
+		print('Cannot connect to the simulator')
+		return results
+
+	durations, result = measure(ptt.acquire_capture_job, nb_repeats)
+	results['serial acquire_capture_job'] = summarize(durations)
+	# Throughput of the last threads_timestamps answers
+	results['serial receive bytes/s'] = sum(device['receive_stats']['bytes'] / device['receive_stats']['duration'] for device in tt.devices)
+	while(not ptt.serial_results.empty()):
+		capture = ptt.serial_results.get_nowait()
+		results['serial nb_records'] = len(capture['records'])
+
+	# The run command also clears the logs of the mcu, so it is measured after the acquisitions
+	for command in ('threads_timestamps_trigger', 'threads_timestamps_run'):
+		durations, result = measure(lambda: ptt.send_command_job(command), nb_repeats)
+		results['serial ' + command] = summarize(durations)
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		tt.disconnect_serial()
+	return results
+
+def main():
+	parser = argparse.ArgumentParser(description='Measures the time spent by each stage of plot_threads_timeline.py on a synthetic capture.')
+	parser.add_argument('--threads', type=int, default=DEFAULT_NB_THREADS, help='number of threads of the capture')
+	parser.add_argument('--switches', type=int, default=DEFAULT_NB_SWITCHES, help='number of context switches of the capture')
+	parser.add_argument('--density', type=float, default=DEFAULT_SAME_TICK_DENSITY, help='probability for a context switch to happen in the same tick as the previous one')
+	parser.add_argument('--trigger', type=float, default=DEFAULT_TRIGGER_POS, help='position of the trigger in the capture (0 to 1), negative for no trigger')
+	parser.add_argument('--exited', type=int, default=DEFAULT_NB_EXITED_THREADS, help='number of dynamic threads exiting during the capture')
+	parser.add_argument('--repeat', type=int, default=DEFAULT_NB_REPEATS, help='number of measures of each stage')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+	parser.add_argument('--simulator', action='store_true', help='also measures the acquisitions through the serial with the simulated Shell (Linux and macOS only)')
+	parser.add_argument('--baudrate', type=int, default=0, help='speed of the simulated Shell in bits per second (0 for no limitation)')
+	parser.add_argument('--devices', type=int, default=1, help='number of simulated mcus read at the same time')
+	parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON file where the results are written')
+	args = parser.parse_args()
+
+	trigger_pos = args.trigger if args.trigger >= 0 else None
+	config = {'threads': args.threads, 'switches': args.switches, 'density': args.density, 'trigger': trigger_pos,
+			  'exited': args.exited, 'repeat': args.repeat, 'seed': args.seed, 'simulator': args.simulator, 'baudrate': args.baudrate,
+			  'devices': args.devices}
+
+	print('Generating the capture')
+	lines_list, lines_data = generate_capture_lines(args.threads, args.switches, args.density, trigger_pos, args.exited, args.seed)
+
+	with tempfile.TemporaryDirectory() as folder:
+		results = run_benchmark(lines_list, lines_data, max(args.repeat, 1), folder)
+	if(results == None):
+		return
+	print('Measuring the start of the script')
+	results.update(run_startup_benchmark(max(args.repeat, 1)))
+	if(args.simulator):
+		print('Measuring the acquisitions with the simulated Shell')
+		results.update(run_acquisition_benchmark(args.threads, args.baudrate, max(args.devices, 1), max(args.repeat, 1)))
+
+	for stage, result in results.items():
+		if(isinstance(result, dict)):
+			print('{:<40} {:9.4f} s'.format(stage, result['min']))
+		else:
+			print('{:<40} {:>11.0f}'.format(stage, result))
+
+	environment = {'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': matplotlib.__version__,
+				   'platform': platform.platform()}
+	with open(args.output, 'w') as file:
+		json.dump({'config': config, 'environment': environment, 'results': results}, file, indent = 1)
+	print('Results written in', args.output)
+
+if(__name__ == '__main__'):
+	main()
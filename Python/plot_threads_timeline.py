@@ -8,21 +8,39 @@
 #					  in the threads_utilities.c/.h files
 #					  Then it prints them on a timeline in order to let the user visualize 
 #					  how the threads are behaving in the time
+#					  The acquisition and the processing of the timestamps are in threads_timestamps.py
 #
 #					  To run the script : "python3 plot_threads_timeline.py serialPort"
+#					  Give several serial ports to draw the threads of several mcus together
+#					  Add "--paced" to send the commands slowly (for slow UART to USB bridges)
+#					  To convert a saved capture : "python3 plot_threads_timeline.py --convert src dst"
+#					  To save captures without window : "python3 plot_threads_timeline.py serialPort --acquire N"
 
-import matplotlib.pyplot as plt
-import  matplotlib.ticker as tick
-from matplotlib.widgets import Button
 import numpy as np
 import random
-import serial
-import struct
+import argparse
+import threading
+import queue
+import json
 import sys
 import time
 import os
+import io
+import contextlib
 from subprocess import Popen, PIPE
 
+import threads_timestamps as tt
+
+# matplotlib is only imported when a figure is created, see import_matplotlib()
+plt 		= None
+tick 		= None
+mcolors 	= None
+Button 		= None
+Rectangle 	= None
+PolyCollection 	= None
+LineCollection 	= None
+mtransforms 	= None
+
 GOODBYE = """
 		  |\      _,,,---,,_
 		  /,`.-'`'    -.  ;-;;,_
@@ -53,7 +71,7 @@ GOODBYE2 = """
 """
 
 # https://developer.apple.com/library/archive/documentation/LanguagesUtilities/Conceptual/MacAutomationScriptingGuide/PromptforaFileName.html
-OPEN_FILE_APPLESCRIPT = """the POSIX path of (choose file with prompt "Please choose a txt file:" of type {"TXT"} default location (get path to desktop folder))"""
+OPEN_FILE_APPLESCRIPT = """the POSIX path of (choose file with prompt "Please choose a txt, txt.gz or tsb file:" of type {"TXT", "gz", "tsb"} default location (get path to desktop folder))"""
 SAVE_FILE_APPLESCRIPT = """the POSIX path of (choose file name with prompt "Please choose a file:" default name "timestamps.txt" default location (get path to desktop folder))"""
 # https://stackoverflow.com/questions/15885132/file-folder-chooser-dialog-from-a-windows-batch-script
 # https://docs.microsoft.com/en-us/dotnet/api/system.windows.forms.filedialog?view=netcore-3.1
@@ -61,7 +79,7 @@ OPEN_FILE_POWERSHELL = """
 Add-Type -AssemblyName System.Windows.Forms
 $FileBrowser = New-Object System.Windows.Forms.OpenFileDialog -Property @{ 
     InitialDirectory = [Environment]::GetFolderPath('Desktop') 
-    Filter = 'Text Files (*.txt)|*.txt|All Files (*.*)|*.*'
+    Filter = 'Text Files (*.txt;*.txt.gz)|*.txt;*.txt.gz|Binary captures (*.tsb)|*.tsb|All Files (*.*)|*.*'
 }
 $null = $FileBrowser.ShowDialog()
 # Writes an error if empty (means we canceled)
@@ -76,7 +94,7 @@ Add-Type -AssemblyName System.Windows.Forms
 $FileBrowser = New-Object System.Windows.Forms.SaveFileDialog -Property @{ 
     InitialDirectory = [Environment]::GetFolderPath('Desktop') 
     FileName = "timestamps.txt"
-    Filter = 'Text Files (*.txt)|*.txt|All Files (*.*)|*.*'
+    Filter = 'Text Files (*.txt)|*.txt|Binary captures (*.tsb)|*.tsb|All Files (*.*)|*.*'
 }
 $null = $FileBrowser.ShowDialog()
 # Writes an error if still default filename (means we canceled)
@@ -117,11 +135,6 @@ case $? in
 esac
 """
 
-NEW_RECEIVED_LINE = '> '
-
-FUNC_SUCCESS = True
-FUNC_FAILED = False
-
 WINDOW_TITLE 		= 'Threads timeline' 
 WINDOWS_SIZE_X 		= 15
 WINDOWS_SIZE_Y 		= 10
@@ -129,7 +142,10 @@ WINDOWS_DPI			= 90
 SUBPLOT_ADJ_LEFT	= 0.12
 SUBPLOT_ADJ_RIGHT	= 0.97
 SUBPLOT_ADJ_TOP		= 0.96
-SUBPLOT_ADJ_BOTTOM	= 0.11
+SUBPLOT_ADJ_BOTTOM	= 0.15
+# overview of the whole capture under the timeline, see draw_minimap()
+MINIMAP_BOTTOM		= 0.07
+MINIMAP_HEIGHT		= 0.03
 
 START_Y_TICKS 					= 10
 SPACING_Y_TICKS 				= 10
@@ -140,362 +156,297 @@ VISUAL_WIDTH_TRIGGER			= 5 # no unit
 VISUAL_MINIMUM_WIDTH_AUTO_ZOOM  = 260 # the bigger this number is, the smaller the smallest bars appear in auto zoom
 MINIMUM_NB_OF_STEPS				= 2
 AUTO_ZOOM_WINDOW_MAX_WIDTH 		= 20 # time unit
-SUBDIVISION_FACTOR_TICK_STEP 	= 2
 ZOOM_LEVEL_THRESHOLD 			= 8
+LOD_MAX_VISIBLE_BARS			= 5000 # above this number of bars in the view, the threads are drawn as density strips
+LOD_MIN_ALPHA					= 0.3 # opacity of a pixel of a density strip barely occupied
+INSPECT_TOLERANCE 				= 4 # pixels around a bar where the mouse still inspects it
+INSPECT_TOOLTIP_OFFSET 			= 15 # points between the mouse and the tooltip
+QUERY_COLOR 					= 'orange'
+QUERY_VIEW_MARGIN 				= 1.5 # width of the view given to a result wider than the view, relative to the result
+# keys centering the view on the next event (with shift the previous one) and applying the auto zoom
+NAVIGATION_KEYS 				= {'t': 'trigger', 'e': 'exit', 'w': 'long_slice', 'b': 'burst', 'i': 'switch'}
+NAVIGATION_LONG_SLICE_WIDTH 	= 5 # ticks, slices reached with the long_slice key
+NAVIGATION_IGNORED_THREADS 		= ['idle'] # threads whose long slices are not reached
 
 DRAW_BACK 						= 0
 DRAW_MIDDLE1 					= 5
 DRAW_MIDDLE2					= 10
 DRAW_FRONT 						= 15
 
-# for the extracted values fields
-REC_THREAD_OUT 		= 0
-REC_THREAD_IN		= 1
-REC_TIME			= 2
-REC_STEP 	 		= 3
-REC_NB_OF_STEPS 	= 4
+# Acquisitions without window, see acquire_captures()
+ACQUIRE_FILE_PREFIX 		= 'timestamps_'
+ACQUIRE_FILE_TIME_FORMAT 	= '%Y%m%d_%H%M%S'
+ACQUIRE_COMMANDS 			= {'run': 'threads_timestamps_run', 'trigger': 'threads_timestamps_trigger'}
 
-# for the raw_values field of a thread
-RAW_TIME 			= 0
-RAW_IN_OUT_TYPE		= 1
-RAW_STEP_NB			= 2
-RAW_NB_OF_STEPS 	= 3
+# Images drawn without window from saved captures, see render_capture_files()
+RENDER_FORMATS 				= ['png', 'svg']
 
 # input possibilities
-port = None
-serial_connected = False
 READ_FROM_SERIAL = 0
 READ_FROM_FILE = 1
 
+# streaming acquisition (successive dumps stitched together)
+STREAM_POLL_INTERVAL = 0.5 # seconds between two dumps
+streaming = False
+
+# serial worker (the serial is used away from the GUI thread)
+SERIAL_RESULTS_TIMER_INTERVAL = 100 # ms
+serial_jobs = queue.Queue()
+serial_results = queue.Queue()
+progress_ax = None
+progress_text = None
+
+fig = None
+gnt = None
 default_graph_pos = [0, 1, 0, 1]
-records = []
+records = np.empty(0, dtype=tt.RECORDS_DTYPE)
+records_steps_table = None
 
 threads = []
-deleted_threads = []
 threads_name_list = []
 trigger_time = None
 trigger_bar = None
+# Artists of the timeline. They are created once with the figure and only updated with each capture
+background_bars = None # areas before the first data and after the exit of the threads
+running_bars = None # running bars of the view, see update_lod()
+device_separators = None # lines between the threads of two devices
+# level of detail rendering : bars of each thread row and density image used when zoomed out
+lod_layers = []
+lod_image = None
+lod_image_extent_y = [0, 1]
+# rectangles and colors of every running bar of the capture, the bars of a layer being contiguous
+# Kept from one capture to the other, see reserve_bars_buffers()
+bars_verts = np.empty((0, 4, 2), dtype=np.float64)
+bars_colors = np.empty((0, 3), dtype=np.float64)
 
 auto_zoom_window_visible = True
 auto_zoom_window = None
 auto_zoom_window_edges = None
 auto_zoom_window_begin = 0
 auto_zoom_window_width = 0
+# inspection of the bars with the mouse, see on_mouse_move()
+inspect_tooltip = None
+inspect_bar = None # layer and index of the bar in the tooltip
+inspect_sources = {} # device name (None with one device) -> records, exits, threads and time offset
+inspect_press_pos = None
+# results of the query given in the command line, highlighted on the timeline, see show_query_results()
+query = None # function giving the results of a capture, see get_query()
+query_results = tt.empty_intervals()
+query_position = -1
+query_highlight = None
+# times of the events reached with the keyboard, see on_key_press()
+navigation_events = {}
+threads_slices = [] # slices of each thread, for the switches of the selected thread
+selected_thread = None # name of the thread selected by clicking on one of its bars
+# overview of the whole capture drawn once per capture, with the rectangle of the view moved over it
+minimap = None
+minimap_image = None
+minimap_view = None
+minimap_background = None
+minimap_drag = None # position of the mouse in the rectangle of the view while it is dragged
+# background of the timeline saved after each drawing, to redraw only the overlays
+# (trigger bar and auto zoom window) over it
+overlays_background = None
 
 text_lines_list = []
 text_lines_data = []
+# captures of the devices when several are drawn together, see merge_devices_captures()
+capture_devices = []
 
-def connect_serial():
-	global port
-	global serial_connected
-
-	if(not serial_connected):
-		try:
-			print('Connecting to port {}'.format(sys.argv[1]))
-			port = serial.Serial(sys.argv[1], timeout=0.1)
-			serial_connected = True
-		except:
-			print('Cannot connect to the device')
-			serial_connected = False
-			return FUNC_FAILED
-
-	print('Connected')
-	return FUNC_SUCCESS
-
-def disconnect_serial():
-	global port
-	global serial_connected
-
-	if(not serial_connected):
-		print('Already disconnected')
-	else:
-		port.close()
-		serial_connected = False
-		print('Disconnected')
+# profiling of the stages (enabled with --profile, see enable_profiling())
+profile_stats = None # stage -> calls, time, max time, bytes and events
+profile_lock = threading.Lock()
+profile_redraw_begin = None
+cprofile_enabled = False
+profilers = [] # one cProfile profiler per profiled thread
 
 def toggle_serial(button):
-	global port
 	# We connect
-	if(not serial_connected):
-		if(connect_serial() == FUNC_SUCCESS):
+	if(not tt.serial_connected):
+		if(tt.connect_serial() == tt.FUNC_SUCCESS):
 			button.label.set_text("Disconnect")
 			button.color='lightcoral'
 	# We disconnect
 	else:
-		disconnect_serial()
+		if(serial_busy()):
+			return
+		tt.disconnect_serial()
 		button.label.set_text("Connect")
 		button.color='lightgreen'
 
-def flush_shell():
-	# In case there was a communication problem
-	# we send two return commands to trigger the sending of 
-	# a new command line from the Shell (to begin from the beginning)
-	port.write(b'\r\n')
-	port.write(b'\r\n')
-	time.sleep(0.1)
-
-	# Flushes the input
-	while(port.inWaiting()):
-		port.read()
-
-def send_command(command, echo):
-	if(echo == True):
-		print('Sent :',command)
-	# A command should finish by a return, otherwise nothing happens
-	command += '\r\n'
-	# We send the command character by character with a small delay
-	# because some UART to USB bridges could miss one if sent to quickly
-	for char in command: 
-		port.write(char.encode('utf-8'))
-		time.sleep(0.001)
-
-
-def receive_text(echo):
-	rcv = bytearray([])
-
-	# We read until the end of the transmission found by searching 
-	# the beginning of a new command line "ch> " from the Shell
-	while(True):
-		rcv += port.read()
-		if(rcv[-4:] == b'ch> '):
+def streaming_job():
+	print('Streaming started')
+	while(streaming):
+		# The devices are read at the same time
+		if(tt.FUNC_FAILED in tt.run_on_devices(tt.stream_device_dump)):
 			break
-	# Converts the bytearray into a string
-	text_rcv = rcv.decode("utf-8")
-	# Splits the strings into lines as we would see them on a terminal
-	text_lines = text_rcv.split('\r\n')
-
-	if(echo == True):
-		print('Received:')
-		for line in text_lines:
-			print(NEW_RECEIVED_LINE, line)
-
-	return text_lines
 
-def clear_data_and_graph():
-	global trigger_time
-	global trigger_bar
-	# Updates the values
-	text_lines_list.clear()
-	text_lines_data.clear()
-	trigger_time = None
+		time.sleep(STREAM_POLL_INTERVAL)
 
-	if(trigger_bar != None):
-		trigger_bar.remove()
-		trigger_bar = None
+	print('Streaming stopped')
 
-	gnt.clear()
-	threads_name_list.clear()
+	# Draws what has been stitched
+	tt.set_serial_status('Processing the stream')
+	capture = tt.merge_devices_captures([tt.build_stream_capture(device) for device in tt.devices])
+	if(capture != None):
+		serial_results.put(capture)
 
-def append_thread(thread_list, name, nb, prio, log):
+def toggle_streaming(button):
+	global streaming
 
-	if(log == 'Yes'):	
-		# Adds a logged thread to the threads list
-		thread_list.append({'name': name,'nb': nb,'prio': prio,'log': True, 'raw_values': [],'have_values': False, 'values': [], 'exit_value': [], 'no_data': []})
+	# We start
+	if(not streaming):
+		if(not tt.serial_connected):
+			print('Serial not connected')
+			return
+		if(serial_busy()):
+			return
+		for device in tt.devices:
+			device['stream'] = tt.new_stream()
+		streaming = True
+		serial_jobs.put(streaming_job)
+		button.label.set_text('Stop streaming')
+		button.color='lightcoral'
+	# We stop, the streaming job then sends what has been stitched to be drawn
 	else:
-		# Adds a non logged thread to the threads list
-		thread_list.append({'name': name,'nb': nb,'prio': prio,'log': False, 'raw_values': [],'have_values': False, 'in_values': [],'out_values': [], 'exit_value': [], 'no_data': []})
-
-
-def process_threads_list_cmd(lines):
-	# What we should receive :
-	# line 0 			: threads_list
-	# line 1 -> n-1 	: Thread number xx : Prio = xxx, Log = xxx, Name = str
-	# line n			: ch>
-
-	deleted = False
-	
-	# If the received text doesn't match what we expect, print it and quit
-	if(lines[1][:len('Thread number')] != 'Thread number'):
-		print('Bad answer received, see below :')
-		for line in lines:
-			print(NEW_RECEIVED_LINE, line)
-		return FUNC_FAILED
-
-	for i in range(1,len(lines)-1):
-		if(not deleted and lines[i] == 'Deleted threads: '):
-			deleted = True
-			continue
-		nb 		= int(lines[i][len('Thread number '):len('Thread number ')+2])
-		prio 	= int(lines[i][len('Thread number xx : Prio = '):len('Thread number xx : Prio = ')+3])
-		log 	= lines[i][len('Thread number xx : Prio = xxx, Log = '):len('Thread number xx : Prio = xxx, Log = ')+3]
-		name 	= lines[i][len('Thread number xx : Prio = xxx, Log = xxx, Name = '):]
-
-		if(deleted):
-			append_thread(deleted_threads, name, nb, prio, log)
-		else:
-			append_thread(threads, name, nb, prio, log)
-
-
-	# The deleted threads are given in the order they have been deleted
-	# and the number they have was the thread number at the time they existed
-	# -> By inserting them to the threads list in the reverse order at their old position, 
-	# 	 we recover the original threads creation order
-	while(len(deleted_threads)):
-		threads.insert(deleted_threads[-1]['nb']-1, deleted_threads.pop(-1))
-
-	return FUNC_SUCCESS
-
-
-def process_threads_timestamps_cmd(lines):
+		streaming = False
+		button.label.set_text('Start streaming')
+		button.color='lightgreen'
 
-	global records
-	# What we should receive (one more line if the trigger mode is enabled) :
-	# line 0 			: threads_timestamps
-	# (line 1)			: Triggered at xxxxxxx
-	# line 1 (2) -> n-1 : From xx to xx at xxxxxxx
-	# line n			: ch>
-
-	first_data_line = 1
-
-	# Gets the trigger time if any
-	if(lines[first_data_line][:len('Triggered at ')] == 'Triggered at '):
-		trigger = int(lines[first_data_line][len('Triggered at '):])
-		first_data_line = 2
-	# No trigger
+def serial_busy():
+	# The serial is used by one job at a time
+	if(streaming):
+		print('Streaming in progress')
+		return True
+	if(serial_jobs.unfinished_tasks > 0):
+		print('Serial busy')
+		return True
+	return False
+
+def serial_worker():
+	# Executes the serial jobs one after the other, away from the GUI thread
+	# to keep the window responsive. The captures obtained are given back through serial_results
+	profiler = None
+	if(cprofile_enabled):
+		profiler = start_cprofile()
+		profiler.disable()
+	while(True):
+		job = serial_jobs.get()
+		if(job == None):
+			serial_jobs.task_done()
+			break
+		# Only the jobs are profiled, not the wait between them
+		if(profiler != None):
+			profiler.enable()
+		try:
+			job()
+		except Exception as error:
+			print('Serial error:', error)
+		if(profiler != None):
+			profiler.disable()
+		tt.set_serial_status('')
+		serial_jobs.task_done()
+
+def acquire_capture_job():
+	print('Getting new data from serial\n')
+
+	# The devices are read at the same time
+	capture = tt.merge_devices_captures(tt.run_on_devices(tt.acquire_device_capture))
+	if(capture != None):
+		serial_results.put(capture)
+
+def get_capture_full_position(capture):
+	# Position in the graph showing the whole capture, saved with the captures acquired without window
+	nb_rows = len([thread for thread in capture['threads'] if thread['have_values']])
+	return [int(capture['records'][0][tt.REC_TIME]), int(capture['records'][-1][tt.REC_TIME]), 0, (nb_rows + 1) * SPACING_Y_TICKS]
+
+def get_acquisition_file_name(output_dir):
+	# Name (without extension) of the files of a new acquisition, given by the date and the time
+	# A number is added if several acquisitions happen in the same second
+	file_name = os.path.join(output_dir, ACQUIRE_FILE_PREFIX + time.strftime(ACQUIRE_FILE_TIME_FORMAT))
+	i = 2
+	name = file_name
+	while(any(existing.startswith(os.path.basename(name)) for existing in os.listdir(output_dir))):
+		name = file_name + '_' + str(i)
+		i += 1
+	return name
+
+def acquire_captures(nb_captures, interval, commands, wait, output_dir, extension):
+	# Acquires the captures of the devices without window and saves them, for automated test benches
+	# Before each capture, the commands (run, trigger) are sent one after the other, each one followed
+	# by a wait of the given seconds. The captures begin every interval seconds (or one right after the other)
+	# and are saved in a file named after the date and the time (one per device if there are several)
+	# nb_captures = 0 to acquire until interrupted
+	# Returns FUNC_FAILED if a capture couldn't be acquired
+	if(tt.connect_serial() == tt.FUNC_FAILED):
+		return tt.FUNC_FAILED
+	os.makedirs(output_dir, exist_ok=True)
+
+	result = tt.FUNC_SUCCESS
+	nb_done = 0
+	next_time = time.perf_counter()
+	try:
+		while(nb_captures == 0 or nb_done < nb_captures):
+			time.sleep(max(0, next_time - time.perf_counter()))
+			next_time = time.perf_counter() + interval
+
+			for command in commands:
+				send_command_job(ACQUIRE_COMMANDS[command])
+				time.sleep(wait)
+
+			print('Getting new data from serial')
+			captures = tt.run_on_devices(tt.acquire_device_capture)
+			file_name = get_acquisition_file_name(output_dir)
+			for device, capture in zip(tt.devices, captures):
+				if(capture == None):
+					print('No valid data received from', tt.get_device_label(device))
+					result = tt.FUNC_FAILED
+					continue
+				file_path = file_name + extension
+				if(len(tt.devices) > 1):
+					file_path = file_name + '_' + tt.get_file_label(tt.get_device_label(device)) + extension
+				tt.write_capture_file(file_path, get_capture_full_position(capture), capture['lines_list'], 
+									capture['lines_data'], capture['records'], capture['trigger'])
+				print(file_path, 'Saved !')
+			nb_done += 1
+	except KeyboardInterrupt:
+		print('Acquisitions stopped')
+
+	tt.disconnect_serial()
+	return result
+
+def send_command_job(command):
+	tt.set_serial_status('Sending ' + command)
+	tt.broadcast_command(command, True)
+	for device in tt.devices:
+		if(len(tt.devices) > 1):
+			print(tt.get_device_label(device), ':')
+		tt.receive_text(device, True)
+
+def process_serial_results():
+	# Called periodically by a timer of the GUI to draw the captures coming from the serial worker
+	while(not serial_results.empty()):
+		show_capture(serial_results.get_nowait())
+	update_progress()
+
+def update_progress():
+	if(progress_text == None):
+		return
+	if(tt.serial_status == ''):
+		text = ''
 	else:
-		trigger = None
-
-	# If the received text doesn't match what we expect, print it and quit
-	if(lines[first_data_line][:len('From ')] != 'From '):
-		print('Bad answer received, see below :')
-		for line in lines:
-			print(NEW_RECEIVED_LINE, line)
-		return 0, FUNC_FAILED
-		
-	counter = None
-	last_time = None
-	# A first process of the records to count how many subdivisions we have per timestamp
-	for i in range(first_data_line,len(lines)-1):
-		time 		= int(lines[i][len('From xx to xx at '):])
-		thread_out 	= int(lines[i][len('From '):len('From ')+2])
-		thread_in 	= int(lines[i][len('From xx to '):len('From xx to ')+2])
-
-		# Now that we know how many records are during the same timestamp
-		# write it back to all the records which happened during this time
-		if (time != last_time):
-			if(counter != None):
-				for j in range(counter+1):
-					records[-(1+j)][REC_NB_OF_STEPS] = counter+1
-			counter = 0
-		else:
-			counter += 1 
-
-		last_time = time
-		records.append([thread_out, thread_in, time, counter, None])
-
-	# Adds the max_counter to the timestamps of the last time (not done in the loop)
-	for j in range(counter+1):
-		records[-(1+j)][REC_NB_OF_STEPS] = counter+1
-
-	# Dispatches the records to the correct threads
-	# Part where we simulate the deletion of the thread to be correct with the threads numbers
-	for record in records:
-		thread_out 	= record[REC_THREAD_OUT]
-		thread_in 	= record[REC_THREAD_IN]
-		time 		= record[REC_TIME]
-		step 		= record[REC_STEP]
-		nb_of_steps = record[REC_NB_OF_STEPS]
-
-		# A thread has been deleted
-		# We simulate the same to be coherent with the numbering of the timestamps
-		if(thread_out == thread_in):
-			deleted_threads.append(threads.pop(thread_out-1))
-			deleted_threads[-1]['raw_values'].append((time, 'exit', step, nb_of_steps))
-		else:
-			# The line after a thread deletion contains a 0 because the out thread doesn't exist anymore
-			# -> ignores the OUT because already written as an EXIT previously
-			if(thread_out != 0):
-				threads[thread_out-1]['raw_values'].append((time, 'out', step, nb_of_steps))
-
-			threads[thread_in-1]['raw_values'].append((time, 'in', step, nb_of_steps))
-
-	# Now that every timestamps are with their respective threads, we put every threads together
-	# again in the same list for the rest of the code
-	while(len(deleted_threads)):
-		threads.insert(deleted_threads[-1]['nb']-1, deleted_threads.pop(-1))
-
-
-	for thread in threads:
-		if(len(thread['raw_values']) > 0):
-			# Thread logged by the MCU
-			if(thread['log']):
-
-				if(thread['raw_values'][0][RAW_IN_OUT_TYPE] == 'out'):
-					if(thread['raw_values'][0][RAW_TIME] == 0):
-						# Insert an IN time in case the first we encounter is an out time and time is 0
-						# Happens with the main thread that has no IN time at boot 
-						# (no context switch to main since it's the first thread to begin)
-						thread['raw_values'].insert(0, (0,'in', 0, 1))
-					else:
-						# Deletes the first value if it's an OUT time to not mess the timeline
-						thread['raw_values'].pop(0)
-
-				# Removes the last value if the number of value is odd
-				# because we need a pair of values
-				if(len(thread['raw_values']) % 2):
-					thread['raw_values'].pop(-1)
-
-				# Adds the values by pair to the thread
-				for i in range(0, len(thread['raw_values']), 2):
-					step = 1/thread['raw_values'][i][RAW_NB_OF_STEPS]
-					# The format for broken_barh needs to be (begin, width)
-					shift = thread['raw_values'][i][RAW_STEP_NB] * step
-					begin = thread['raw_values'][i][RAW_TIME] + shift
-					width = thread['raw_values'][i+1][RAW_TIME] - thread['raw_values'][i][RAW_TIME] - shift
-					
-					if(width <  1):
-						width = step
-
-					thread['values'].append((begin, width))
-
-					# Draws a no data area to show where the first data is on the timeline
-					if(i == 0):
-						thread['no_data'].append((records[0][REC_TIME], begin - records[0][REC_TIME]))
-
-					# Also draw something when we exit a thread
-					if(thread['raw_values'][i+1][RAW_IN_OUT_TYPE] == 'exit'):
-						thread['exit_value'].append((begin + step, records[-1][REC_TIME] - (begin + step)))
-				# Indicates if we have timestamps to draw
-				if(len(thread['values']) > 0):
-					thread['have_values'] = True
-
-			# Thread not logged by the MCU
-			else:
-				# Adds one by one the incomplete values
-				for i in range(0, len(thread['raw_values']), 1):
-					step = 1/thread['raw_values'][i][RAW_NB_OF_STEPS]
-					# size of an IN or OUT tick (for incomplete data)
-					tick_step = step/SUBDIVISION_FACTOR_TICK_STEP
-					# The format for broken_barh needs to be (begin, width)
-					shift = thread['raw_values'][i][RAW_STEP_NB] * step
-					begin = thread['raw_values'][i][RAW_TIME] + shift
-
-					if(thread['raw_values'][i][RAW_IN_OUT_TYPE] == 'in'):
-						thread['in_values'].append((begin, tick_step))
-
-					elif(thread['raw_values'][i][RAW_IN_OUT_TYPE] == 'out'):
-						thread['out_values'].append((begin - tick_step, tick_step))
-
-					# For incomplete data, exiting a thread is drawn the same as an OUT time
-					# except for the color
-					elif(thread['raw_values'][i][RAW_IN_OUT_TYPE] == 'exit'):
-						thread['exit_value'].append((begin - tick_step, records[-1][REC_TIME] - (begin - tick_step)))
-
-					# Draws a no data area to show where the first data is on the timeline
-					if(i == 0):
-						thread['no_data'].append((records[0][REC_TIME], begin - records[0][REC_TIME]))
-
-				# Indicates if we have timestamps to draw
-				if((len(thread['in_values']) > 0) or (len(thread['out_values']) > 0)):
-					thread['have_values'] = True
-
-	return trigger, FUNC_SUCCESS
-
-def get_thread_prio(thread):
-	return thread['prio']
-
-def sort_threads_by_prio():
-	threads.sort(key=get_thread_prio)
+		nb_bytes = sum(device['receive_stats']['bytes'] for device in tt.devices)
+		text = '{}... {} bytes received'.format(tt.serial_status, nb_bytes)
+	if(text == progress_text.get_text()):
+		return
+	progress_text.set_text(text)
+	# Redraws only the progress area, not the whole timeline
+	if(fig.canvas.supports_blit):
+		progress_ax.draw_artist(progress_ax.patch)
+		progress_ax.draw_artist(progress_text)
+		fig.canvas.blit(progress_ax.bbox)
+	else:
+		fig.canvas.draw_idle()
 
 def show_all_data_graph(event):
 	gnt.axes.set_xlim(default_graph_pos[0], default_graph_pos[1])
@@ -505,51 +456,41 @@ def show_all_data_graph(event):
 
 def auto_zoom_data_graph(event):
 	a=gnt.axes.get_xlim()
-	actual_x_pos = (a[1] + a[0]) / 2
+	auto_zoom_at((a[1] + a[0]) / 2)
+	print('Auto zoom done')
 
+def auto_zoom_at(actual_x_pos):
 	window_begin = actual_x_pos - auto_zoom_window_width/2
 	window_end = actual_x_pos + auto_zoom_window_width/2
 
 	# Searches for the maximum number of steps present inside the auto zoom window
 	# This defines the zoom level in order to show correctly the smallest bars present
 	number_of_steps = MINIMUM_NB_OF_STEPS
-	for record in records:
-		if record[REC_TIME] <= window_end and record[REC_TIME] >= window_begin:
-			if record[REC_NB_OF_STEPS] > number_of_steps:
-				number_of_steps = record[REC_NB_OF_STEPS]
+	first, last = tt.get_records_range(records, window_begin, window_end)
+	if(first < last):
+		number_of_steps = max(number_of_steps, tt.query_range_max(records_steps_table, first, last))
 
 	half_visual_auto_zoom_area = VISUAL_MINIMUM_WIDTH_AUTO_ZOOM / number_of_steps / 2
 
 	gnt.axes.set_xlim(actual_x_pos-half_visual_auto_zoom_area, actual_x_pos+half_visual_auto_zoom_area)
 	plt.draw()
-	print('Auto zoom done')
 
-def redraw_auto_zoom_window(x_nb_values_printed, x_pos):
-	global auto_zoom_window
-	global auto_zoom_window_edges
+def update_auto_zoom_window(x_nb_values_printed, x_pos):
 	global auto_zoom_window_width
-	global auto_zoom_window_visible
 
-	if(auto_zoom_window_visible):
-		if(auto_zoom_window != None):
-			auto_zoom_window.remove()
-			auto_zoom_window_edges.remove()
-		# Prints an area to show the auto zoom window
-		# Resizes the window in order to never be bigger than one third of the timeline
-		auto_zoom_window_width = AUTO_ZOOM_WINDOW_MAX_WIDTH
-		if(auto_zoom_window_width >= x_nb_values_printed/3):
-			auto_zoom_window_width = x_nb_values_printed/3
-		elif(auto_zoom_window_width < x_nb_values_printed/12):
-			auto_zoom_window_width = x_nb_values_printed/12
-
-		# We need to draw two different objects. One on top of everything for the edges and one behind everything for the infill
-		auto_zoom_window		= gnt.barh(0, auto_zoom_window_width, (len(threads_name_list)+1)*SPACING_Y_TICKS, x_pos-auto_zoom_window_width/2, align='edge', color='0.95', zorder=DRAW_BACK)
-		auto_zoom_window_edges 	= gnt.barh(0, auto_zoom_window_width, (len(threads_name_list)+1)*SPACING_Y_TICKS, x_pos-auto_zoom_window_width/2, align='edge', edgecolor='0', linewidth=1, fill=False, zorder=DRAW_FRONT)
-	else:
-		if(auto_zoom_window != None):
-			auto_zoom_window.remove()
-			auto_zoom_window_edges.remove()
-			auto_zoom_window = None
+	# Moves the area showing the auto zoom window
+	# Resizes the window in order to never be bigger than one third of the timeline
+	auto_zoom_window_width = AUTO_ZOOM_WINDOW_MAX_WIDTH
+	if(auto_zoom_window_width >= x_nb_values_printed/3):
+		auto_zoom_window_width = x_nb_values_printed/3
+	elif(auto_zoom_window_width < x_nb_values_printed/12):
+		auto_zoom_window_width = x_nb_values_printed/12
+
+	for patch in (auto_zoom_window, auto_zoom_window_edges):
+		patch.set_x(x_pos - auto_zoom_window_width/2)
+		patch.set_width(auto_zoom_window_width)
+		# Never drawn if we have no data
+		patch.set_visible(auto_zoom_window_visible and len(records) > 0)
 
 def toggle_auto_zoom_window(button):
 	global auto_zoom_window_visible
@@ -559,7 +500,7 @@ def toggle_auto_zoom_window(button):
 
 	# Never draws the auto zoom window if we have no data
 	# Updates the button
-	if(len(text_lines_data) > 0):
+	if(len(records) > 0):
 		if button.label.get_text() == 'Hide auto zoom window':
 			button.label.set_text('Show auto zoom window')
 			button.color='lightcoral'
@@ -569,29 +510,392 @@ def toggle_auto_zoom_window(button):
 			button.color='lightgreen'
 			auto_zoom_window_visible = True
 
-		redraw_auto_zoom_window(xlimits[1] - xlimits[0], (xlimits[1] + xlimits[0]) / 2)
+		update_auto_zoom_window(xlimits[1] - xlimits[0], (xlimits[1] + xlimits[0]) / 2)
+		blit_overlays()
+
 
+def update_trigger_bar(x_nb_values_printed):
+	# Updates the trigger only if we have one value
+	trigger_bar.set_visible(trigger_time != None)
+	if(trigger_time == None):
+		return
+	trigger_width = VISUAL_WIDTH_TRIGGER * x_nb_values_printed/(fig.get_figwidth()*WINDOWS_DPI)
+	trigger_bar.set_x(trigger_time - trigger_width/2)
+	trigger_bar.set_width(trigger_width)
 
-def redraw_trigger_bar(x_nb_values_printed):
+def create_overlays():
 	global trigger_bar
-	# Redraws the trigger only if we have one value
-	if(trigger_time != None):
-		trigger_width = VISUAL_WIDTH_TRIGGER * x_nb_values_printed/(fig.get_figwidth()*WINDOWS_DPI)
-		if(trigger_bar != None):
-			trigger_bar.remove()
-		trigger_bar = gnt.broken_barh([(trigger_time - trigger_width/2, trigger_width)], (0, (len(threads_name_list)+1)*SPACING_Y_TICKS), facecolors='red', zorder=DRAW_FRONT)
+	global auto_zoom_window
+	global auto_zoom_window_edges
+	global inspect_tooltip
+
+	# The overlays are created with the figure and are then only moved when the limits change
+	# Their sizes are given by update_trigger_bar() and update_auto_zoom_window() and their
+	# heights by show_capture()
+	# They are added as artists and not as patches, so their position doesn't count in the limits of the timeline
+	trigger_bar = gnt.add_artist(Rectangle((0, 0), 0, 0, facecolor='red', zorder=DRAW_FRONT, animated=True, visible=False))
+
+	# We need to draw two different objects. One for the infill and one for the edges
+	# The infill is drawn over the threads, so it is transparent to let them visible
+	auto_zoom_window 		= gnt.add_artist(Rectangle((0, 0), 0, 0, facecolor='0', alpha=0.05, zorder=DRAW_BACK, animated=True, visible=False))
+	auto_zoom_window_edges 	= gnt.add_artist(Rectangle((0, 0), 0, 0, edgecolor='0', linewidth=1, fill=False, zorder=DRAW_FRONT, animated=True, visible=False))
+
+	# Details of the bar under the mouse, see on_mouse_move()
+	inspect_tooltip = gnt.annotate('', (0, 0), xytext=(0, 0), textcoords='offset points', fontsize='small', zorder=DRAW_FRONT,
+									bbox={'boxstyle': 'round', 'facecolor': 'lightyellow', 'alpha': 0.9}, animated=True, visible=False)
+
+def draw_overlays():
+	for overlay in (auto_zoom_window, auto_zoom_window_edges, trigger_bar, inspect_tooltip):
+		if(overlay.get_visible()):
+			gnt.draw_artist(overlay)
+
+# Called after each drawing of the figure. The animated overlays are not drawn with the rest
+# of the figure so we save the background without them and then draw them on top
+def on_draw(event):
+	global overlays_background
+	global minimap_background
+	# When saving an image, matplotlib already draws the animated artists
+	if(fig.canvas.is_saving()):
+		return
+	if(fig.canvas.supports_blit):
+		overlays_background = fig.canvas.copy_from_bbox(gnt.bbox)
+		minimap_background = fig.canvas.copy_from_bbox(minimap.bbox)
+	draw_overlays()
+	minimap.draw_artist(minimap_view)
+
+def blit_overlays():
+	# Redraws only the overlays over the saved background, without redrawing the threads
+	if((overlays_background == None) or (not fig.canvas.supports_blit)):
+		fig.canvas.draw_idle()
+		return
+	fig.canvas.restore_region(overlays_background)
+	draw_overlays()
+	fig.canvas.blit(gnt.bbox)
+
+def blit_minimap():
+	# Redraws only the rectangle of the view over the saved minimap, without redrawing the threads
+	if((minimap_background == None) or (not fig.canvas.supports_blit)):
+		fig.canvas.draw_idle()
+		return
+	fig.canvas.restore_region(minimap_background)
+	minimap.draw_artist(minimap_view)
+	fig.canvas.blit(minimap.bbox)
+
+def fill_bars_verts(verts, intervals, y_row, height = RECT_HEIGHT):
+	# Same rectangles as the ones broken_barh would create, but built at once
+	begin 	= intervals[:, 0]
+	end 	= begin + intervals[:, 1]
+	verts[:, 0, 0] = begin
+	verts[:, 1, 0] = begin
+	verts[:, 2, 0] = end
+	verts[:, 3, 0] = end
+	verts[:, 0, 1] = y_row
+	verts[:, 1, 1] = y_row + height
+	verts[:, 2, 1] = y_row + height
+	verts[:, 3, 1] = y_row
+
+def make_bars(bars):
+	# Rectangles and colors of the bars given as (intervals, y_row, color)
+	nb_bars = sum(len(intervals) for intervals, y_row, color in bars)
+	verts = np.empty((nb_bars, 4, 2), dtype=np.float64)
+	colors = np.empty((nb_bars, 3), dtype=np.float64)
+	offset = 0
+	for intervals, y_row, color in bars:
+		fill_bars_verts(verts[offset:offset + len(intervals)], intervals, y_row)
+		colors[offset:offset + len(intervals)] = mcolors.to_rgb(color)
+		offset += len(intervals)
+	return verts, colors
+
+def reserve_bars_buffers(nb_bars):
+	# The buffers of the running bars are reused by the next captures (the dumps of a stream have
+	# about the same size), they are only allocated again when they are too small or far too big
+	global bars_verts
+	global bars_colors
+	if((len(bars_verts) < nb_bars) or (len(bars_verts) > 4 * nb_bars)):
+		bars_verts = np.empty((nb_bars, 4, 2), dtype=np.float64)
+		bars_colors = np.empty((nb_bars, 3), dtype=np.float64)
+
+def add_lod_layer(thread, key, row, y_row, color, offset):
+	# The bars of thread[key] are written in the buffers at offset. The running bars collection
+	# is filled later with only the bars of the view
+	intervals = thread[key]
+	fill_bars_verts(bars_verts[offset:offset + len(intervals)], intervals, y_row)
+	bars_colors[offset:offset + len(intervals)] = mcolors.to_rgb(color)
+	# The bars of the view are found with the sorted endpoints of the bars
+	layer = tt.build_intervals_index(intervals)
+	layer.update({'thread': thread, 'key': key, 'row': row, 'color': mcolors.to_rgb(color), 'offset': offset,
+				  'cum_widths': np.concatenate(([0], np.cumsum(intervals[:, 1])))})
+	lod_layers.append(layer)
+
+def compute_lod_layer_coverage(layer, edges):
+	# Length covered by the bars before each edge, computed with the cumulated widths
+	# minus the part of the last bar begun which is after the edge
+	started = np.searchsorted(layer['begins'], edges, side='right')
+	covered = layer['cum_widths'][started]
+	last = np.maximum(started - 1, 0)
+	overflow = np.clip(layer['ends'][last] - edges, 0, None)
+	overflow[started == 0] = 0
+	covered = covered - overflow
+	# Fraction of each pixel occupied by the bars
+	return np.clip(np.diff(covered) / np.diff(edges), 0, 1)
+
+def compute_lod_density(x_begin, x_end, nb_rows, nb_pixels):
+	# Returns the image of the density strips of every row between x_begin and x_end
+	edges = np.linspace(x_begin, x_end, nb_pixels + 1)
+
+	color_sum = np.zeros((nb_rows, nb_pixels, 3), dtype=np.float64)
+	coverage_sum = np.zeros((nb_rows, nb_pixels), dtype=np.float64)
+	for layer in lod_layers:
+		coverage = compute_lod_layer_coverage(layer, edges)
+		color_sum[layer['row']] += coverage[:, np.newaxis] * layer['color']
+		coverage_sum[layer['row']] += coverage
+
+	# The color of a pixel is the mix of the colors of the bars in it and its opacity
+	# tells how much the thread is running. Every pixel with a bar stays visible
+	occupied = coverage_sum > 0
+	image = np.zeros((nb_rows, nb_pixels, 4), dtype=np.float64)
+	image[occupied, 0:3] = color_sum[occupied] / coverage_sum[occupied][:, np.newaxis]
+	image[occupied, 3] = LOD_MIN_ALPHA + (1 - LOD_MIN_ALPHA) * np.minimum(coverage_sum[occupied], 1)
+
+	# Given as bytes, matplotlib doesn't have to convert the floats at each draw
+	return (image * 255).astype(np.uint8)
+
+def draw_lod_density(x_begin, x_end, nb_rows):
+	lod_image.set_data(compute_lod_density(x_begin, x_end, nb_rows, max(1, int(gnt.bbox.width))))
+	lod_image.set_extent([x_begin, x_end, lod_image_extent_y[0], lod_image_extent_y[1]])
+
+# Draws the exact bars when there are few of them in the view and a density strip per thread otherwise
+def update_lod(x_begin, x_end):
+	nb_visible_bars = 0
+	for layer in lod_layers:
+		first, last = tt.get_intervals_range(layer, x_begin, x_end)
+		nb_visible_bars += last - first
+
+	if(nb_visible_bars <= LOD_MAX_VISIBLE_BARS):
+		# Also gives the bars around the view to not have holes while panning
+		margin = x_end - x_begin
+		visible_bars = [np.empty(0, dtype=np.int64)]
+		for layer in lod_layers:
+			first, last = tt.get_intervals_range(layer, x_begin - margin, x_end + margin)
+			visible_bars.append(np.arange(layer['offset'] + first, layer['offset'] + last))
+		visible_bars = np.concatenate(visible_bars)
+		running_bars.set_verts(bars_verts[visible_bars])
+		running_bars.set_facecolor(bars_colors[visible_bars])
+		running_bars.set_visible(True)
+		lod_image.set_visible(False)
 	else:
-		if(trigger_bar != None):
-			trigger_bar.remove()
-			trigger_bar = None
+		running_bars.set_visible(False)
+		draw_lod_density(x_begin, x_end, len(threads_name_list))
+		lod_image.set_visible(True)
 
 # We redraw the trigger bar in a way that its visual width is constant
 def on_xlims_change(axes):
 	a=axes.get_xlim()
 	nb_values_printed = a[1]-a[0]
 	actual_x_pos = (a[1] + a[0]) / 2
-	redraw_trigger_bar(nb_values_printed)
-	redraw_auto_zoom_window(nb_values_printed, actual_x_pos)
+	update_trigger_bar(nb_values_printed)
+	update_auto_zoom_window(nb_values_printed, actual_x_pos)
+	update_lod(a[0], a[1])
+	# The tooltip would not follow its bar
+	hide_inspect_tooltip()
+	minimap_view.set_x(a[0])
+	minimap_view.set_width(nb_values_printed)
+
+def draw_minimap(x_begin, x_end, nb_rows):
+	# The whole capture is drawn once as density strips, moving the view only moves the rectangle over it
+	minimap_image.set_data(compute_lod_density(x_begin, x_end, nb_rows, max(1, int(minimap.bbox.width))))
+	minimap_image.set_extent([x_begin, x_end, 0, max(nb_rows, 1)])
+	minimap.set_xlim(x_begin, x_end)
+	minimap.set_ylim(0, max(nb_rows, 1))
+
+def update_inspect_sources():
+	# The records of the bars are searched in the capture of their device, with the numbering of its threads
+	inspect_sources.clear()
+	if(len(capture_devices) == 0):
+		inspect_sources[None] = {'records': records, 'exits': tt.get_records_exits(records), 'threads': threads, 'offset': 0}
+	for device in capture_devices:
+		capture = device['capture']
+		inspect_sources[device['name']] = {'records': capture['records'], 'exits': tt.get_records_exits(capture['records']), 
+											'threads': capture['threads'], 'offset': device['offset']}
+
+def find_bar(x, y):
+	# Returns the layer and the index of the bar at (x, y) or None
+	# The row is given by y and the bar by a binary search in the beginnings of the bars of the row
+	row = int(round((y - START_Y_TICKS) / SPACING_Y_TICKS))
+	if(abs(y - (START_Y_TICKS + SPACING_Y_TICKS * row)) > RECT_HEIGHT/2):
+		return None
+
+	# The bars thinner than a pixel can be inspected from a few pixels around them
+	xlimits = gnt.axes.get_xlim()
+	tolerance = INSPECT_TOLERANCE * (xlimits[1] - xlimits[0]) / gnt.bbox.width
+	bar = None
+	bar_distance = tolerance
+	for layer in lod_layers:
+		if(layer['row'] != row):
+			continue
+		# The bars of a layer don't overlap, so only the last one beginning before x
+		# and the next one can be at x
+		next_bar = np.searchsorted(layer['begins'], x, side='right')
+		for index in (next_bar - 1, next_bar):
+			if(0 <= index < len(layer['begins'])):
+				distance = max(layer['begins'][index] - x, x - layer['ends'][index], 0)
+				if(distance <= bar_distance):
+					bar = (layer, index)
+					bar_distance = distance
+	return bar
+
+def get_record_thread_name(source, index, column):
+	# Name of the thread given in the column of the record index
+	number = int(source['records'][column][index])
+	thread = tt.get_numbered_thread(source['threads'], source['exits'], index, number)
+	if(thread == None):
+		return 'unknown (exited thread)' if number == 0 else 'unknown'
+	return thread['name']
+
+def describe_bar(layer, index):
+	# Returns the lines describing the bar, with the threads before and after it taken in the records
+	thread = layer['thread']
+	begin = layer['begins'][index]
+	width = layer['ends'][index] - begin
+	name = thread['name']
+	if('device' in thread):
+		name = thread['device'] + ':' + name
+	lines = ['{} (Prio {})'.format(name, thread['prio']),
+			 'Begin : {:.3f}'.format(begin),
+			 'Width : {:.3f}'.format(width)]
+
+	# The bar begins at its record except the OUT ticks of the not logged threads which end at it
+	source = inspect_sources[thread.get('device')]
+	position = begin + width if layer['key'] == 'out_values' else begin
+	record = tt.get_record_index(source['records'], position - source['offset'])
+	if(record == None):
+		return lines
+	lines.append('Step : {}/{}'.format(source['records'][tt.REC_STEP][record] + 1, source['records'][tt.REC_NB_OF_STEPS][record]))
+
+	if(layer['key'] == 'out_values'):
+		lines.append('Switched out for : ' + get_record_thread_name(source, record, tt.REC_THREAD_IN))
+		return lines
+	lines.append('Switched in after : ' + get_record_thread_name(source, record, tt.REC_THREAD_OUT))
+	# A logged thread runs until the next record, which switches it out or exits it
+	if(layer['key'] == 'values' and record + 1 < len(source['records'])):
+		if(record + 1 in source['exits']):
+			lines.append('Exited')
+		else:
+			lines.append('Switched out for : ' + get_record_thread_name(source, record + 1, tt.REC_THREAD_IN))
+	return lines
+
+def hide_inspect_tooltip():
+	global inspect_bar
+	inspect_bar = None
+	if(inspect_tooltip.get_visible()):
+		inspect_tooltip.set_visible(False)
+		return True
+	return False
+
+def on_mouse_move(event):
+	global inspect_bar
+	if(minimap_drag != None):
+		move_minimap_view(event)
+		return
+	# Nothing while dragging (moving or zooming the timeline)
+	if(event.button != None):
+		return
+
+	bar = None
+	if(event.inaxes == gnt):
+		bar = find_bar(event.xdata, event.ydata)
+	if(bar == None):
+		if(hide_inspect_tooltip()):
+			blit_overlays()
+		return
+	# The tooltip stays where it appeared while the mouse is over the same bar
+	if(inspect_bar != None and inspect_bar[0] is bar[0] and inspect_bar[1] == bar[1]):
+		return
+	inspect_bar = bar
+
+	# The tooltip is on the side of the center of the timeline to stay inside of it
+	xlimits = gnt.axes.get_xlim()
+	ylimits = gnt.axes.get_ylim()
+	right = event.xdata > (xlimits[0] + xlimits[1]) / 2
+	top = event.ydata > (ylimits[0] + ylimits[1]) / 2
+	inspect_tooltip.set_text('\n'.join(describe_bar(*bar)))
+	inspect_tooltip.xy = (event.xdata, event.ydata)
+	inspect_tooltip.xyann = (-INSPECT_TOOLTIP_OFFSET if right else INSPECT_TOOLTIP_OFFSET, -INSPECT_TOOLTIP_OFFSET if top else INSPECT_TOOLTIP_OFFSET)
+	inspect_tooltip.set_horizontalalignment('right' if right else 'left')
+	inspect_tooltip.set_verticalalignment('top' if top else 'bottom')
+	inspect_tooltip.set_visible(True)
+	blit_overlays()
+
+def on_mouse_press(event):
+	global inspect_press_pos
+	global minimap_drag
+	inspect_press_pos = (event.x, event.y)
+
+	# The rectangle of the view is dragged from where it is clicked,
+	# clicking outside of it moves its center to the mouse first
+	if(event.inaxes == minimap and event.button == 1):
+		x = event.xdata
+		if(not (minimap_view.get_x() <= x <= minimap_view.get_x() + minimap_view.get_width())):
+			minimap_view.set_x(x - minimap_view.get_width()/2)
+		minimap_drag = x - minimap_view.get_x()
+		blit_minimap()
+
+def move_minimap_view(event):
+	# Only the rectangle is moved while dragging, the timeline is drawn once released
+	x = minimap.transData.inverted().transform((event.x, event.y))[0]
+	minimap_view.set_x(x - minimap_drag)
+	blit_minimap()
+
+# A click without moving the timeline prints the details of the bar
+def on_mouse_release(event):
+	global minimap_drag
+	if(minimap_drag != None):
+		minimap_drag = None
+		gnt.axes.set_xlim(minimap_view.get_x(), minimap_view.get_x() + minimap_view.get_width())
+		plt.draw()
+		return
+	if(event.inaxes != gnt or inspect_press_pos != (event.x, event.y)):
+		return
+	bar = find_bar(event.xdata, event.ydata)
+	if(bar != None):
+		print('\n'.join(describe_bar(*bar)))
+		select_thread(bar[0]['thread'])
+
+def select_thread(thread):
+	# The switches to and from the selected thread are reached with the keyboard, see on_key_press()
+	global selected_thread
+	selected_thread = thread['name']
+	if('device' in thread):
+		selected_thread = thread['device'] + ':' + selected_thread
+	print('Selected thread : ' + selected_thread)
+
+def on_key_press(event):
+	if(event.key == None or event.key.lower() not in NAVIGATION_KEYS):
+		return
+	event_name = NAVIGATION_KEYS[event.key.lower()]
+	# Nothing to go to before a capture is drawn
+	if(len(records) == 0 or (event_name != 'switch' and event_name not in navigation_events)):
+		print('No data to navigate')
+		return
+	direction = -1 if event.key.isupper() else 1
+	xlimits = gnt.axes.get_xlim()
+	position = (xlimits[0] + xlimits[1]) / 2
+
+	if(event_name == 'switch'):
+		selected = [index for thread, index in zip(threads, threads_slices) if selected_thread != None and tt.is_thread_named(thread, selected_thread)]
+		if(len(selected) == 0):
+			print('No thread selected, click on a bar of a thread to select it')
+			return
+		time = tt.get_next_switch(selected[0], position, direction)
+	else:
+		time = tt.get_next_event(navigation_events[event_name], position, direction)
+
+	description = '{} {}'.format('next' if direction > 0 else 'previous', event_name.replace('_', ' '))
+	if(time == None):
+		print('No ' + description)
+		return
+	auto_zoom_at(time)
+	print('Centered on the {} at {:.3f}'.format(description, time))
 
 # Only for MacOS
 def exec_applescript(script):
@@ -626,46 +930,115 @@ def exec_bash(script):
 	err = err.replace('\n', '')
 	return out, err
 
-def split_file_name_extension(file_path):
-	# Splits the name and the extension of the file
-	file_name = file_path
-	while(True):
-		file_name, extension = os.path.splitext(file_name)
-		if(len(extension) == 0):
-			break
-	extension = file_path[len(file_name):]
-
-	return file_name, extension
-
-def write_timestamps_to_file():
-
-	if(len(text_lines_data) == 0):
-		print('No data to save !')
-		return
-
+def ask_file_path(applescript, powershell_script, bash_script):
+	# Opens the file selection window of the OS
+	# Returns the file path and the error message (empty if no error)
+	file_path = ''
 	# MACOS
 	if(sys.platform == 'darwin'):
-		file_path, error = exec_applescript(SAVE_FILE_APPLESCRIPT)
+		file_path, error = exec_applescript(applescript)
 	# Windows
 	elif(sys.platform == 'win32'):
-		file_path, error = exec_powershell(SAVE_FILE_POWERSHELL)
+		file_path, error = exec_powershell(powershell_script)
 	# Linux
 	elif(sys.platform == 'linux'):
-		file_path, error = exec_bash(SAVE_FILE_BASH_LINUX)
+		file_path, error = exec_bash(bash_script)
 	else:
 		error = 'Your OS is not supported'
 
+	return file_path, error
+
+def render_capture_file(file_path, image_path, cache_dir):
+	# Draws the capture saved in the file into an image, with the saved position, without window
+	# Executed in the processes of render_capture_files(), so the messages are given back
+	# with the result instead of being printed
+	# Returns True if the image has been written and the messages
+	tt.capture_cache_dir = cache_dir
+	import_matplotlib()
+	plt.switch_backend('Agg')
+	messages = io.StringIO()
+	with contextlib.redirect_stdout(messages):
+		create_figure()
+		capture = tt.read_capture_file(file_path)
+		if(capture != None):
+			show_capture(capture)
+			fig.savefig(image_path)
+		plt.close(fig)
+	return capture != None, messages.getvalue()
+
+def find_capture_files(paths):
+	# Returns the capture files given, the folders being replaced by the capture files they contain
+	capture_files = []
+	for path in paths:
+		if(os.path.isdir(path)):
+			for name in sorted(os.listdir(path)):
+				if(any(name.endswith(extension) for extension in tt.CAPTURE_EXTENSIONS)):
+					capture_files.append(os.path.join(path, name))
+		else:
+			capture_files.append(path)
+	return capture_files
+
+def render_capture_files(paths, output_dir, image_format, nb_jobs):
+	# Draws an image of each capture file (or of each capture file of the folders) in parallel processes
+	# The images are written next to the files, or in output_dir if given, with the name of the file
+	capture_files = find_capture_files(paths)
+	if(len(capture_files) == 0):
+		print('No capture file found')
+		return tt.FUNC_FAILED
+
+	images = []
+	for file_path in capture_files:
+		file_name, extension = tt.split_file_name_extension(file_path)
+		if(output_dir != None):
+			file_name = os.path.join(output_dir, os.path.basename(file_name))
+		# Same capture saved in several formats
+		if(file_name + '.' + image_format in images):
+			file_name += extension.replace('.', '_')
+		images.append(file_name + '.' + image_format)
+	if(output_dir != None):
+		os.makedirs(output_dir, exist_ok=True)
+
+	result = tt.FUNC_SUCCESS
+	# only loaded when used, to not slow down the start of the script
+	from concurrent.futures import ProcessPoolExecutor
+	with ProcessPoolExecutor(max_workers=nb_jobs) as executor:
+		jobs = [executor.submit(render_capture_file, file_path, image_path, tt.capture_cache_dir) 
+				for file_path, image_path in zip(capture_files, images)]
+		for file_path, image_path, job in zip(capture_files, images, jobs):
+			try:
+				rendered, messages = job.result()
+			except Exception as error:
+				rendered, messages = False, 'Error: {}\n'.format(error)
+			if(rendered):
+				print(image_path, 'Saved !')
+			else:
+				print(file_path, 'not drawn :')
+				print(messages, end='')
+				result = tt.FUNC_FAILED
+	return result
+
+def write_timestamps_to_file(file_path = None):
+
+	if(len(records) == 0):
+		print('No data to save !')
+		return
+
+	# Asks for the file if not given
+	error = ''
+	if(file_path == None):
+		file_path, error = ask_file_path(SAVE_FILE_APPLESCRIPT, SAVE_FILE_POWERSHELL, SAVE_FILE_BASH_LINUX)
+
 	if(len(error) > 0):
 		print('File not saved')
 		print('Error:', error)
 		return
 
 	# Splits the name and the extension of the file
-	file_name, extension = split_file_name_extension(file_path)
+	file_name, extension = tt.split_file_name_extension(file_path)
 
-	# Adds the txt extension if not present
-	if(extension != '.txt'):
-		extension += '.txt'
+	# Adds the txt extension if not present (and if another format is not asked)
+	if(extension not in tt.CAPTURE_EXTENSIONS):
+		extension += tt.CAPTURE_TXT_EXTENSION
 		print('.txt automatically added to the file name')
 		# Adds a number to the name if the file already exists
 		# Only if we added the .txt extension
@@ -681,309 +1054,631 @@ def write_timestamps_to_file():
 
 	file_path = file_name + extension
 
-	# Opens the file as Write Text
-	file = open(file_path,'wt')
-
-	# Writes the position in the graph
+	# Saves the position in the graph with the data
 	xlim = gnt.axes.get_xlim()
 	ylim = gnt.axes.get_ylim()
-	file.write('Saved position\n')
-	file.write(str(xlim[0]) + '\n' + str(xlim[1]) + '\n' + str(ylim[0]) + '\n' + str(ylim[1]) + '\n')
 
-	# Writes the lines to the file
-	for line in text_lines_list:
-		file.write(line + '\n')
-	for line in text_lines_data:
-		file.write(line + '\n')
+	# Several devices : one file per device, named after the device
+	# The position is given in the times of the device, with all its threads visible
+	if(len(capture_devices) > 0):
+		for device in capture_devices:
+			capture = device['capture']
+			device_path = file_name + '_' + tt.get_file_label(device['name']) + extension
+			nb_rows = len([thread for thread in capture['threads'] if thread['have_values']])
+			tt.write_capture_file(device_path, [xlim[0] - device['offset'], xlim[1] - device['offset'], 0, (nb_rows + 1) * SPACING_Y_TICKS],
+								capture['lines_list'], capture['lines_data'], capture['records'], capture['trigger'])
+			print(device_path, 'Saved !')
+		return
 
-	file.close()
+	tt.write_capture_file(file_path, [xlim[0], xlim[1], ylim[0], ylim[1]], text_lines_list, text_lines_data, records, trigger_time)
 	print(file_path, 'Saved !')
 
-
-def load_timestamps_from_file():
-	file_path = ''
-	# MACOS
-	if(sys.platform == 'darwin'):
-		file_path, error = exec_applescript(OPEN_FILE_APPLESCRIPT)
-	# Windows
-	elif(sys.platform == 'win32'):
-		file_path, error = exec_powershell(OPEN_FILE_POWERSHELL)
-	# Linux
-	elif(sys.platform == 'linux'):
-		file_path, error = exec_bash(OPEN_FILE_BASH_LINUX)
-	else:
-		error = 'Your OS is not supported'
+def load_timestamps_from_file(file_path = None):
+	# Asks for the file if not given
+	error = ''
+	if(file_path == None):
+		file_path, error = ask_file_path(OPEN_FILE_APPLESCRIPT, OPEN_FILE_POWERSHELL, OPEN_FILE_BASH_LINUX)
 
 	if(len(error) > 0):
 		print('Error:', error)
-		error = True
-	else:
-		error = False
-
-		try:
-			# Opens the file as Read Text
-			file = open(file_path, 'rt')
-		except:
-			print("File doesn't exist")
-			error = True
-
-	if(not error):
-		print('Loading file ',file_path)
-		rcv_text = file.read()
-		file.close()
-		rcv_lines = rcv_text.split('\n')
-		index_pos = None
-		index_list = None
-		index_data = None
-
-		# j is used to correct the index in the case we remove an empty line
-		j = 0
-		for i in range(len(rcv_lines)):
-			# Removes empty lines
-			if(len(rcv_lines[i-j]) == 0):
-				rcv_lines.pop(i-j)
-				j += 1
-				continue
-			# Searches for the beginning of the Saved position fields
-			if((index_pos == None) and (rcv_lines[i-j].find('Saved position') != -1)):
-				index_pos = i-j
-			# Searches for the beginning of the thread_list fields
-			if((index_list == None) and (rcv_lines[i-j].find('threads_list') != -1)):
-				index_list = i-j
-			#searches for the beginning of the threads_timestamps fields
-			elif((index_data == None) and (rcv_lines[i-j].find('threads_timestamps') != -1)):
-				index_data = i-j
-
-		# Tests if the file ends with ch> 
-		if(rcv_lines[-1] != 'ch> '):
-			error = True
-
-		# Tests if we found all the fields
-		if(index_pos == None or index_list == None or index_data == None):
-			error = True
-		else:
-			# Removes the Saved position for the rcv_lines_pos list
-			rcv_lines_pos  = rcv_lines[index_pos + 1:index_list]
-			rcv_lines_list = rcv_lines[index_list:index_data]
-			rcv_lines_data = rcv_lines[index_data:]
-
-	if(not error):
-		print('File loaded')
-		return rcv_lines_pos, rcv_lines_list, rcv_lines_data
-	else:
-		return [], [file_path,'File not recognized'], []
-
+		return None
 
-def read_new_timestamps(input_src):
+	return tt.read_capture_file(file_path)
 
-	global trigger_bar
-	global trigger_time
-	global text_lines_list
-	global text_lines_data
-	global serial_connected
-	global default_graph_pos
-	global records
-
-	threads.clear()
-	deleted_threads.clear()
-	records.clear()
+def read_new_timestamps(input_src, file_path = None):
 
 	if(input_src == READ_FROM_SERIAL):
 
-		if(not serial_connected):
+		if(not tt.serial_connected):
 			print('Serial not connected')
 			return
-
-		flush_shell()
-
-		print('Getting new data from serial\n')
-
-		# Sends command "threads_list"
-		send_command('threads_list', True)
-		lines_list = receive_text(True)
-		result = process_threads_list_cmd(lines_list)
-		if(result == FUNC_FAILED):
+		if(serial_busy()):
 			return
 
-		# Sends command "threads_timestamps"
-		send_command('threads_timestamps', True)
-		lines_data = receive_text(False)
-		trigger, result = process_threads_timestamps_cmd(lines_data)
-		if(result == FUNC_FAILED):
-			return
-
-		# We only read a saved position from a file
-		lines_pos = None
+		# The capture will be drawn by process_serial_results() once received
+		serial_jobs.put(acquire_capture_job)
+		return
 
 	elif(input_src == READ_FROM_FILE):
-		lines_pos, lines_list, lines_data = load_timestamps_from_file()
+		capture = load_timestamps_from_file(file_path)
 
-		result = process_threads_list_cmd(lines_list)
-		if(result == FUNC_FAILED):
-			return
-
-		trigger, result = process_threads_timestamps_cmd(lines_data)
-		if(result == FUNC_FAILED):
-			return
+	if(capture != None):
+		show_capture(capture)
 
-	clear_data_and_graph()
+def show_capture(capture):
+	global threads
+	global records
+	global records_steps_table
+	global trigger_time
+	global text_lines_list
+	global text_lines_data
+	global capture_devices
+	global default_graph_pos
+	global lod_image_extent_y
+	global navigation_events
+	global threads_slices
 
 	# Updates the values
-	text_lines_list = lines_list
-	text_lines_data = lines_data
-	trigger_time = trigger
-
-	sort_threads_by_prio()
+	threads = capture['threads']
+	records = capture['records']
+	records_steps_table = capture['steps_table']
+	text_lines_list = capture['lines_list']
+	text_lines_data = capture['lines_data']
+	capture_devices = capture.get('devices', [])
+	trigger_time = capture['trigger']
+	lines_pos = capture['lines_pos']
 
+	threads_name_list.clear()
 	for thread in threads:
 		if(thread['have_values']):
 			# Splits th names into multiple lines to spare space next to the graph
-			threads_name_list.append(thread['name'].replace(' ','\n') + '\nPrio:'+ str(thread['prio']))
+			name = thread['name']
+			# Tells to which device the thread belongs if there are several
+			if('device' in thread):
+				name = thread['device'] + ':' + name
+			threads_name_list.append(name.replace(' ','\n') + '\nPrio:'+ str(thread['prio']))
 
 	print('New data received, redrawing the timeline')
 
-	gnt.set_title('Threads timeline')
-
-	# Setting labels for x-axis and y-axis 
-	gnt.set_xlabel('System ticks since boot')
-	gnt.set_ylabel('Threads')
-
 	# Setting ticks on y-axis 
 	gnt.set_yticks(range(START_Y_TICKS, (len(threads_name_list)+1)*SPACING_Y_TICKS, SPACING_Y_TICKS))
 	# Labeling ticks of y-axis 
 	gnt.set_yticklabels(threads_name_list, multialignment='center')
 
-	gnt.xaxis.set_major_locator(tick.MaxNLocator(integer=True, min_n_ticks=0))
-	gnt.xaxis.get_major_formatter().set_useOffset(False)
-	gnt.grid(which='major', color='#000000', linestyle='-', zorder=DRAW_FRONT)
-	gnt.grid(which='minor', color='#CCCCCC', linestyle='--')
-
-	# Setting graph attribute 
-	gnt.grid(b = True, which='both')
-
+	# The artists of the timeline are only given the new rectangles, the graph isn't cleared
 	# Draws a rectangle every time a thread is running
+	# The running bars are only given to matplotlib for the current view, see update_lod()
 	row = 0
+	device = None
+	background = []
+	running = []
+	separators = []
 	for thread in threads:
 		if(thread['have_values']):
+			# Line between the groups of threads of two devices
+			if(row > 0 and thread.get('device') != device):
+				y_separator = START_Y_TICKS + SPACING_Y_TICKS * (row - 0.5)
+				separators.append([(0, y_separator), (1, y_separator)])
+			device = thread.get('device')
 			y_row = (START_Y_TICKS +  SPACING_Y_TICKS * row) - RECT_HEIGHT/2
 			# Grey area to tell where the first data is
-			gnt.broken_barh(thread['no_data'], (y_row, RECT_HEIGHT), facecolors='0.7', alpha=0.5, zorder=DRAW_MIDDLE1)
+			background.append((thread['no_data'], y_row, '0.7'))
 			# Red area to tell the thread is ended
-			gnt.broken_barh(thread['exit_value'], (y_row, RECT_HEIGHT), facecolors='red', alpha=0.5, zorder=DRAW_MIDDLE1)
+			background.append((thread['exit_value'], y_row, 'red'))
 
 			if(thread['log']):
 				# If de data are complete (aka this thread was logged), we draw the rectangles
-				gnt.broken_barh(thread['values'], (y_row, RECT_HEIGHT), facecolors='blue', zorder=DRAW_MIDDLE2)
+				running.append((thread, 'values', row, y_row, 'blue'))
 			else:
 				# If the data are incomplete (IN and OUT times are missing because this thread wasn't logged),
 				# we draw the IN times in Green and the OUT in RED
-				gnt.broken_barh(thread['in_values'], (y_row, RECT_HEIGHT), facecolors='green', zorder=DRAW_MIDDLE2)
-				gnt.broken_barh(thread['out_values'], (y_row, RECT_HEIGHT), facecolors='red', zorder=DRAW_MIDDLE2)
+				running.append((thread, 'in_values', row, y_row, 'green'))
+				running.append((thread, 'out_values', row, y_row, 'red'))
 			row += 1
 
-	# Draws the first time the trigger bar
-	xlimits = gnt.axes.get_xlim()
-	ylimits = gnt.axes.get_ylim()
-	redraw_trigger_bar(xlimits[1] - xlimits[0])
-	# Then draws the first auto zoom window. Need to take the new limits because the trigger
-	# bar may have changed them
-	xlimits = gnt.axes.get_xlim()
-	ylimits = gnt.axes.get_ylim()
-	redraw_auto_zoom_window(xlimits[1] - xlimits[0], (xlimits[1] + xlimits[0]) / 2)
-
-	# Saves the default position
-	default_graph_pos = [xlimits[0], xlimits[1], ylimits[0], ylimits[1]]
-
-	# Set the callback for the next times (when we move or zoom)
-	gnt.callbacks.connect('xlim_changed', on_xlims_change)
+	background_verts, background_colors = make_bars(background)
+	background_bars.set_verts(background_verts)
+	background_bars.set_facecolor(background_colors)
+	device_separators.set_segments(separators)
+
+	nb_bars = sum(len(thread[key]) for thread, key, row, y_row, color in running)
+	reserve_bars_buffers(nb_bars)
+	lod_layers.clear()
+	offset = 0
+	for thread, key, row, y_row, color in running:
+		add_lod_layer(thread, key, row, y_row, color, offset)
+		offset += len(thread[key])
+	update_inspect_sources()
+	set_query_results(tt.empty_intervals())
+	navigation_events = tt.build_events_index(capture, NAVIGATION_LONG_SLICE_WIDTH, NAVIGATION_IGNORED_THREADS)
+	threads_slices = tt.get_capture_slices_index(capture)
+	# One pixel wide columns of the density strips of every row, drawn when zoomed out
+	lod_image_extent_y = [START_Y_TICKS - RECT_HEIGHT/2, START_Y_TICKS - RECT_HEIGHT/2 + len(threads_name_list)*SPACING_Y_TICKS]
+
+	# The trigger bar and the auto zoom window take the whole height of the graph
+	height = (len(threads_name_list)+1)*SPACING_Y_TICKS
+	for overlay in (trigger_bar, auto_zoom_window, auto_zoom_window_edges):
+		overlay.set_height(height)
+
+	# The default position shows all the data with the margins the autoscale of matplotlib would add
+	# The autoscale isn't used because the artists kept from the previous captures would count in it
+	x_bounds = [] if trigger_time == None else [trigger_time]
+	for verts in (background_verts, bars_verts[:nb_bars]):
+		if(len(verts) > 0):
+			x_bounds += [verts[:, 0, 0].min(), verts[:, 2, 0].max()]
+	if(len(x_bounds) == 0):
+		x_bounds = [0, 1]
+	x_min, x_max = mtransforms.nonsingular(min(x_bounds), max(x_bounds), expander=0.05)
+	x_margin, y_margin = gnt.margins()
+	default_graph_pos = [x_min - (x_max - x_min)*x_margin, x_max + (x_max - x_min)*x_margin, -height*y_margin, height*(1 + y_margin)]
+	draw_minimap(default_graph_pos[0], default_graph_pos[1], len(threads_name_list))
+
+	# The overlays and the bars of the view are updated by on_xlims_change()
+	gnt.axes.set_ylim(default_graph_pos[2], default_graph_pos[3])
+	gnt.axes.set_xlim(default_graph_pos[0], default_graph_pos[1])
 
 	# Updates the tool-bar to remove the history on zoom/displacement and set the new home
-	fig.canvas.toolbar.update()
+	# (no tool-bar when drawn without window)
+	if(fig.canvas.toolbar != None):
+		fig.canvas.toolbar.update()
 
 	# Updates the position in the graph if read from a file
 	if(lines_pos != None):
 		gnt.axes.set_xlim(float(lines_pos[0]), float(lines_pos[1]))
 		gnt.axes.set_ylim(float(lines_pos[2]), float(lines_pos[3]))
 
+	if(query != None):
+		show_query_results(query(capture))
+
 	plt.draw()
 	print('Drawing finished')
 
+def set_query_results(results):
+	global query_results
+	global query_position
+	query_results = results
+	query_position = -1
+	verts = np.empty((len(results), 4, 2), dtype=np.float64)
+	fill_bars_verts(verts, results, 0, 1)
+	query_highlight.set_verts(verts)
+
+def show_query_results(results):
+	# Highlights the results of a query (see the queries of threads_timestamps.py) and goes to the first one
+	set_query_results(results)
+	print('Query : {} results'.format(len(results)))
+	if(len(results) > 0):
+		go_to_query_result(0)
+
+def go_to_query_result(position):
+	# Centers the view on the result, zoomed out if the result is wider than the view
+	global query_position
+	if(len(query_results) == 0):
+		print('No query result')
+		return
+	query_position = position % len(query_results)
+	begin, width = query_results[query_position]
+	xlimits = gnt.axes.get_xlim()
+	view_width = max(xlimits[1] - xlimits[0], width * QUERY_VIEW_MARGIN)
+	gnt.axes.set_xlim(begin + width/2 - view_width/2, begin + width/2 + view_width/2)
+	plt.draw()
+	print('Result {}/{} : begin {:.3f}, width {:.3f}'.format(query_position + 1, len(query_results), begin, width))
+
+def get_query(args):
+	# Returns the function giving the results of the query of the command line for a capture, None if no query
+	# Raises ValueError if a number given isn't valid
+	if(args.find_long != None):
+		thread_name = args.find_long[0]
+		min_width = float(args.find_long[1])
+		return lambda capture: tt.query_long_slices(capture, thread_name, min_width)
+	if(args.find_gaps != None):
+		return lambda capture: tt.query_gaps(capture, args.find_gaps, args.ignore)
+	if(args.find_alternations != None):
+		thread_a, thread_b = args.find_alternations[0:2]
+		min_switches = int(args.find_alternations[2])
+		return lambda capture: tt.query_alternations(capture, thread_a, thread_b, min_switches, args.max_gap)
+	return None
+
 def timestamps_trigger(event):
-	if(not serial_connected):
+	if(not tt.serial_connected):
 		print('Serial not connected')
 		return
-	# Sends command "threads_stat"
-	send_command('threads_timestamps_trigger', True)
-	receive_text(True)
+	if(serial_busy()):
+		return
+	# Sends command "threads_timestamps_trigger"
+	serial_jobs.put(lambda: send_command_job('threads_timestamps_trigger'))
 
 def timestamps_run(event):
-	if(not serial_connected):
+	if(not tt.serial_connected):
 		print('Serial not connected')
 		return
-	# Sends command "threads_stat"
-	send_command('threads_timestamps_run', True)
-	receive_text(True)
-
-###################              BEGINNING OF PROGRAMM               ###################
-
-# Tests if the serial port as been given as argument in the terminal
-if (len(sys.argv) == 1):
-	print('No serial port given')
-	print('To use the serial, provide the serial port as argument')
-	serial_port_given = False
-else:
-	if(len(sys.argv) > 2):
-		print('Too many arguments given. Only the first one will be used')
-	serial_port_given = True
-
-# Declaring a figure "gnt" 
-# figsize is in inch
-fig, gnt = plt.subplots(figsize=(WINDOWS_SIZE_X, WINDOWS_SIZE_Y), dpi=WINDOWS_DPI, num=WINDOW_TITLE)
-
-plt.subplots_adjust(left = SUBPLOT_ADJ_LEFT, right=SUBPLOT_ADJ_RIGHT, top=SUBPLOT_ADJ_TOP, bottom = SUBPLOT_ADJ_BOTTOM)
-
-loadAx 						= plt.axes([0.12, 0.025, 0.08, 0.04])
-saveAx 						= plt.axes([0.20, 0.025, 0.08, 0.04])
-zoomAx 						= plt.axes([0.325, 0.025, 0.08, 0.04])
-showAllAx 					= plt.axes([0.405, 0.025, 0.08, 0.04])
-
-showAutoZoomAx 				= plt.axes([0.325, 0.002, 0.16, 0.02])
-
-loadButton 					= Button(loadAx, 'Load file', color='lightblue', hovercolor='0.7')
-saveButton					= Button(saveAx, 'Save file', color='lightblue', hovercolor='0.7')
-zoomButton 					= Button(zoomAx, 'Time Auto zoom', color='lightblue', hovercolor='0.7')
-showAllButton 				= Button(showAllAx, 'Show all data', color='lightblue', hovercolor='0.7')
-
-showAutoZoomButton 			= Button(showAutoZoomAx, 'Hide auto zoom window', color='lightgreen', hovercolor='0.7')
+	if(serial_busy()):
+		return
+	# Sends command "threads_timestamps_run"
+	serial_jobs.put(lambda: send_command_job('threads_timestamps_run'))
+
+def add_profile_sample(stage, duration, nb_bytes, nb_events):
+	# The stages of several devices can be measured at the same time
+	with profile_lock:
+		if(stage not in profile_stats):
+			profile_stats[stage] = {'calls': 0, 'time': 0.0, 'max_time': 0.0, 'bytes': 0, 'events': 0}
+		stats = profile_stats[stage]
+		stats['calls'] += 1
+		stats['time'] += duration
+		stats['max_time'] = max(stats['max_time'], duration)
+		stats['bytes'] += nb_bytes
+		stats['events'] += nb_events
+
+def profile_function(function, stage, count, starts_redraw):
+	# Returns the function measuring the duration of each call in the given stage
+	# count(args, result) gives the number of bytes and of events (lines, records...) of the call
+	# starts_redraw tells that the call asks matplotlib to draw again, the rendering being
+	# measured until the end of the drawing (see profile_rendering())
+	def profiled_function(*args):
+		global profile_redraw_begin
+		begin_time = time.perf_counter()
+		if(starts_redraw and profile_redraw_begin == None):
+			profile_redraw_begin = begin_time
+		result = function(*args)
+		duration = time.perf_counter() - begin_time
+		nb_bytes, nb_events = count(args, result)
+		add_profile_sample(stage, duration, nb_bytes, nb_events)
+		return result
+	return profiled_function
+
+def profile_rendering(function):
+	# Returns the draw_event callback measuring the time from the change of the view to the end of the drawing
+	def profiled_function(event):
+		global profile_redraw_begin
+		if(profile_redraw_begin != None):
+			add_profile_sample('draw: rendering', time.perf_counter() - profile_redraw_begin, 0, 1)
+			profile_redraw_begin = None
+		return function(event)
+	return profiled_function
+
+def count_lines_bytes(lines):
+	return sum(len(line) for line in lines)
+
+def count_capture_file(args, result):
+	if(result == None):
+		return 0, 0
+	return os.path.getsize(args[0]), len(result[3])
+
+# Functions measured when the profiling is enabled, with the stage in which they are counted and
+# the bytes and events they handle. Some stages are nested in others (parse in receive for example)
+PROFILED_FUNCTIONS = [
+	('flush_shell', 					'serial: flush_shell', 				lambda args, result: (0, 0)),
+	('send_command', 					'serial: send_command', 			lambda args, result: (len(args[1]) + len('\r\n'), 1)),
+	('broadcast_command', 				'serial: broadcast_command', 		lambda args, result: ((len(args[0]) + len('\r\n')) * len(tt.devices), len(tt.devices))),
+	('receive_text', 					'serial: receive_text', 			lambda args, result: (args[0]['receive_stats']['bytes'], len(result))),
+	('receive_timestamps', 				'serial: receive_timestamps', 		lambda args, result: (args[0]['receive_stats']['bytes'], len(result[0]))),
+	('read_txt_capture', 				'file: read txt', 					count_capture_file),
+	('read_binary_capture', 			'file: read binary', 				count_capture_file),
+	('get_capture_file_cache_key', 		'file: cache key', 					lambda args, result: (0, 0)),
+	('read_cached_capture', 			'file: read cache', 				lambda args, result: (0, 0 if result == None else len(result['records']))),
+	('write_cached_capture', 			'file: write cache', 				lambda args, result: (0, len(args[1]['records']))),
+	('write_capture_file', 				'file: write', 						lambda args, result: (os.path.getsize(args[0]), len(args[4]))),
+	('parse_timestamps_lines', 			'parse: timestamps lines', 			lambda args, result: (count_lines_bytes(args[0]), 0 if result is None else len(result))),
+	('process_threads_list_cmd', 		'parse: threads list', 				lambda args, result: (count_lines_bytes(args[0]), sum(len(threads) for threads in args[1:] if threads is not None))),
+	('parse_threads_timestamps_cmd', 	'parse: unwrap times', 				lambda args, result: (0, 0 if result[1] is None else len(result[1]))),
+	('process_records', 				'process: intervals', 				lambda args, result: (0, len(args[0]))),
+	('build_range_max_table', 			'process: range max table', 		lambda args, result: (0, len(args[0]))),
+	('merge_devices_captures', 			'process: merge devices', 			lambda args, result: (0, len(args[0]))),
+	('stitch_dump', 					'process: stitch stream', 			lambda args, result: (0, len(args[3]))),
+	('build_events_index', 				'process: events index', 			lambda args, result: (0, len(args[0]['records']))),
+	('show_capture', 					'draw: show_capture', 				lambda args, result: (0, len(args[0]['records']))),
+	('on_xlims_change', 				'draw: on_xlims_change', 			lambda args, result: (0, 1)),
+	('update_lod', 						'draw: update_lod', 				lambda args, result: (0, 1)),
+]
+
+def enable_profiling(with_cprofile):
+	# Replaces the functions of the stages by measured ones. Nothing is changed when the profiling
+	# is not enabled so it costs nothing. Needs to be called before create_figure()
+	global profile_stats
+	global cprofile_enabled
+	global on_draw
+	profile_stats = {}
+	for name, stage, count in PROFILED_FUNCTIONS:
+		starts_redraw = name in ['show_capture', 'on_xlims_change']
+		# the functions which don't draw are in threads_timestamps.py
+		module_functions = globals() if name in globals() else vars(tt)
+		module_functions[name] = profile_function(module_functions[name], stage, count, starts_redraw)
+	on_draw = profile_rendering(on_draw)
+
+	# cProfile only sees the thread in which it is enabled, the serial worker has its own profiler
+	# (the threads reading several devices at the same time are not seen)
+	cprofile_enabled = with_cprofile
+	if(cprofile_enabled):
+		start_cprofile()
+
+def start_cprofile():
+	import cProfile
+	profiler = cProfile.Profile()
+	profilers.append(profiler)
+	profiler.enable()
+	return profiler
+
+def print_profile_summary():
+	print('Time spent in each stage (some stages are nested in others) :')
+	print('{:<28}{:>8}{:>12}{:>12}{:>14}{:>10}'.format('stage', 'calls', 'total (s)', 'max (s)', 'bytes', 'events'))
+	with profile_lock:
+		for stage in sorted(profile_stats, key=lambda stage: profile_stats[stage]['time'], reverse=True):
+			stats = profile_stats[stage]
+			print('{:<28}{:>8}{:>12.4f}{:>12.4f}{:>14}{:>10}'.format(stage, stats['calls'], stats['time'], stats['max_time'], stats['bytes'], stats['events']))
+
+def write_profile(file_path):
+	# .json files get the time of each stage, the other ones the cProfile statistics (see pstats)
+	file_name, extension = tt.split_file_name_extension(file_path)
+	if(extension == '.json'):
+		with profile_lock:
+			with open(file_path, 'w') as file:
+				json.dump({'stages': profile_stats}, file, indent=1)
+	else:
+		import pstats
+		for profiler in profilers:
+			profiler.disable()
+		pstats.Stats(*profilers).dump_stats(file_path)
+	print(file_path, 'Saved !')
 
-zoomButton.on_clicked(auto_zoom_data_graph)
-showAllButton.on_clicked(show_all_data_graph)
-loadButton.on_clicked(lambda x: read_new_timestamps(READ_FROM_FILE))
-saveButton.on_clicked(lambda x: write_timestamps_to_file())
+def quit_profiling(file_path):
+	print_profile_summary()
+	if(file_path != ''):
+		write_profile(file_path)
 
-showAutoZoomButton.on_clicked(lambda x: toggle_auto_zoom_window(showAutoZoomButton))
+###################              BEGINNING OF PROGRAMM               ###################
 
-if(serial_port_given):
-	triggerAx             		= plt.axes([0.53, 0.025, 0.1, 0.04])
-	runAx             			= plt.axes([0.63, 0.025, 0.1, 0.04])
-	readAx             			= plt.axes([0.77, 0.025, 0.1, 0.04])
-	connectionAx 				= plt.axes([0.87, 0.025, 0.1, 0.04])
+def import_matplotlib():
+	# matplotlib takes time to load, so it is only imported when a figure is needed
+	# The acquisitions and the conversions without window don't import it at all
+	global plt
+	global tick
+	global mcolors
+	global Button
+	global Rectangle
+	global PolyCollection
+	global LineCollection
+	global mtransforms
+	import matplotlib.pyplot as plt
+	import matplotlib.ticker as tick
+	import matplotlib.colors as mcolors
+	from matplotlib.widgets import Button
+	from matplotlib.patches import Rectangle
+	from matplotlib.collections import PolyCollection, LineCollection
+	import matplotlib.transforms as mtransforms
+
+def create_timeline():
+	global background_bars
+	global running_bars
+	global device_separators
+	global lod_image
+	global query_highlight
 
-	triggerButton             	= Button(triggerAx, 'Trigger', color='lightcoral', hovercolor='0.7')
-	runButton	             	= Button(runAx, 'Run', color='lightgreen', hovercolor='0.7')
-	readButton             		= Button(readAx, 'Get new data', color='lightgreen', hovercolor='0.7')
-	connectionButton 			= Button(connectionAx, 'Connect', color='lightgreen', hovercolor='0.7')
+	gnt.set_title('Threads timeline')
 
-	triggerButton.on_clicked(timestamps_trigger)
-	runButton.on_clicked(timestamps_run)
-	readButton.on_clicked(lambda x: read_new_timestamps(READ_FROM_SERIAL))
-	connectionButton.on_clicked(lambda x: toggle_serial(connectionButton))
+	# Setting labels for x-axis and y-axis 
+	gnt.set_xlabel('System ticks since boot')
+	gnt.set_ylabel('Threads')
 
-# Auto select the pan/zoom tool from the toolbar for convenience
-plt.get_current_fig_manager().toolbar.pan()
+	gnt.xaxis.set_major_locator(tick.MaxNLocator(integer=True, min_n_ticks=0))
+	gnt.xaxis.get_major_formatter().set_useOffset(False)
+	gnt.grid(which='major', color='#000000', linestyle='-', zorder=DRAW_FRONT)
+	gnt.grid(which='minor', color='#CCCCCC', linestyle='--')
 
-plt.show()
+	# Setting graph attribute 
+	gnt.grid(True, which='both')
+
+	# A few artists for all the threads, whatever their number. Each capture only changes
+	# their rectangles and colors (see show_capture()), so the graph is never cleared
+	background_bars = gnt.add_collection(PolyCollection([], alpha=0.5, zorder=DRAW_MIDDLE1), autolim=False)
+	running_bars = gnt.add_collection(PolyCollection([], zorder=DRAW_MIDDLE2), autolim=False)
+	device_separators = gnt.add_collection(LineCollection([], colors='black', linewidths=2, zorder=DRAW_FRONT,
+															transform=gnt.get_yaxis_transform()), autolim=False)
+	# The results of the queries take the whole height of the graph
+	query_highlight = gnt.add_collection(PolyCollection([], facecolors=QUERY_COLOR, edgecolors=QUERY_COLOR, alpha=0.3, zorder=DRAW_BACK,
+															transform=gnt.get_xaxis_transform()), autolim=False)
+	lod_image = gnt.imshow(np.zeros((1, 1, 4), dtype=np.uint8), extent=[0, 1, 0, 1], origin='lower', aspect='auto',
+							interpolation='nearest', zorder=DRAW_MIDDLE2, visible=False)
+	create_overlays()
+
+	# The limits are only changed by the user and by show_capture(). It also prevents the artists
+	# updated when the limits change from changing them again
+	gnt.set_autoscale_on(False)
+	gnt.callbacks.connect('xlim_changed', on_xlims_change)
 
-disconnect_serial()
-# Be polite, say goodbye :-)
-print(GOODBYE)
+def create_minimap():
+	global minimap
+	global minimap_image
+	global minimap_view
+
+	minimap = fig.add_axes([SUBPLOT_ADJ_LEFT, MINIMAP_BOTTOM, SUBPLOT_ADJ_RIGHT - SUBPLOT_ADJ_LEFT, MINIMAP_HEIGHT])
+	minimap.set_xticks([])
+	minimap.set_yticks([])
+	# Moved with the mouse by its own functions, not by the tool-bar
+	minimap.set_navigate(False)
+	minimap_image = minimap.imshow(np.zeros((1, 1, 4), dtype=np.uint8), extent=[0, 1, 0, 1], origin='lower', aspect='auto',
+									interpolation='nearest')
+	minimap_view = minimap.add_patch(Rectangle((0, 0), 0, 1, transform=minimap.get_xaxis_transform(), facecolor=(0, 0, 0, 0.2),
+												edgecolor='0', linewidth=1, animated=True))
+
+def create_figure():
+	global fig
+	global gnt
+
+	import_matplotlib()
+
+	# Declaring a figure "gnt" 
+	# figsize is in inch
+	fig, gnt = plt.subplots(figsize=(WINDOWS_SIZE_X, WINDOWS_SIZE_Y), dpi=WINDOWS_DPI, num=WINDOW_TITLE)
+
+	plt.subplots_adjust(left = SUBPLOT_ADJ_LEFT, right=SUBPLOT_ADJ_RIGHT, top=SUBPLOT_ADJ_TOP, bottom = SUBPLOT_ADJ_BOTTOM)
+
+	create_minimap()
+	create_timeline()
+
+	# Draws the overlays over the timeline after each drawing
+	fig.canvas.mpl_connect('draw_event', on_draw)
+
+	# Inspection of the bars with the mouse
+	fig.canvas.mpl_connect('motion_notify_event', on_mouse_move)
+	fig.canvas.mpl_connect('button_press_event', on_mouse_press)
+	fig.canvas.mpl_connect('button_release_event', on_mouse_release)
+	fig.canvas.mpl_connect('key_press_event', on_key_press)
+
+def main():
+	global progress_ax
+	global progress_text
+	global streaming
+	global query
+
+	parser = argparse.ArgumentParser(description='Draws the timeline of the threads of a ChibiOS mcu using the threads_timestamps functions.')
+	parser.add_argument('ports', nargs='*', metavar='port', help='serial port of the Shell of the mcu (several ports to draw several mcus together)')
+	parser.add_argument('--align', choices=[tt.ALIGN_ON_TRIGGER, tt.ALIGN_ON_START, tt.ALIGN_NONE], default=tt.ALIGN_ON_TRIGGER, help='how the timelines of several mcus are aligned')
+	parser.add_argument('--paced', action='store_true', help='sends the commands character by character with a delay (for slow UART to USB bridges)')
+	parser.add_argument('--convert', nargs=2, metavar=('SOURCE', 'DESTINATION'), help='converts a saved capture between the .txt and .tsb formats (given by the extensions) and quits')
+	parser.add_argument('--render', nargs='+', metavar='FILE', help='draws the saved captures (files or folders of captures) into images without window and quits')
+	parser.add_argument('--output-dir', metavar='DIR', help='folder of the images drawn by --render (next to the captures by default) or of the captures saved by --acquire (current folder by default)')
+	parser.add_argument('--format', choices=RENDER_FORMATS, default=RENDER_FORMATS[0], help='format of the images drawn by --render')
+	parser.add_argument('--jobs', type=int, metavar='N', help='number of captures drawn at the same time by --render (number of processors by default)')
+	parser.add_argument('--acquire', type=int, metavar='N', help='acquires N captures from the ports without window (0 to acquire until interrupted), saves them and quits')
+	parser.add_argument('--send', nargs='+', choices=list(ACQUIRE_COMMANDS), default=[], help='commands sent before each capture of --acquire, in the given order')
+	parser.add_argument('--wait', type=float, default=1, metavar='SECONDS', help='time waited after each command given by --send')
+	parser.add_argument('--interval', type=float, default=0, metavar='SECONDS', help='time between the beginnings of two captures of --acquire (one right after the other by default)')
+	parser.add_argument('--save-format', choices=[extension.lstrip('.') for extension in tt.CAPTURE_EXTENSIONS], default=tt.CAPTURE_TXT_EXTENSION.lstrip('.'), help='format of the files saved by --acquire')
+	parser.add_argument('--find-long', nargs=2, metavar=('THREAD', 'TICKS'), help='highlights the slices of the thread longer than TICKS in the captures drawn')
+	parser.add_argument('--find-gaps', type=float, metavar='TICKS', help='highlights the times longer than TICKS during which no thread ran (see --ignore)')
+	parser.add_argument('--ignore', nargs='+', default=[], metavar='THREAD', help='threads not counted by --find-gaps (idle for example)')
+	parser.add_argument('--find-alternations', nargs=3, metavar=('THREAD', 'THREAD', 'COUNT'), help='highlights the times during which the two threads ran one after the other more than COUNT times')
+	parser.add_argument('--max-gap', type=float, default=0, metavar='TICKS', help='time allowed between two slices of --find-alternations (0 : switched directly)')
+	parser.add_argument('--no-cache', action='store_true', help='always parses the files opened instead of taking them from the cache of the processed captures')
+	parser.add_argument('--profile', nargs='?', const='', metavar='FILE', help='prints the time spent in each stage when quitting and saves it to FILE if given (.json, or cProfile statistics for the other extensions)')
+	args = parser.parse_args()
+
+	try:
+		query = get_query(args)
+	except ValueError as error:
+		parser.error(error)
+
+	if(args.profile != None):
+		enable_profiling(args.profile != '' and not args.profile.endswith('.json'))
+
+	if(not args.no_cache):
+		tt.capture_cache_dir = tt.get_default_cache_dir()
+
+	if(args.convert != None):
+		result = tt.convert_capture_file(args.convert[0], args.convert[1])
+		if(args.profile != None):
+			quit_profiling(args.profile)
+		if(result == tt.FUNC_FAILED):
+			sys.exit(1)
+		sys.exit(0)
+
+	if(args.render != None):
+		if(render_capture_files(args.render, args.output_dir, args.format, args.jobs) == tt.FUNC_FAILED):
+			sys.exit(1)
+		sys.exit(0)
+
+	if(args.paced):
+		tt.send_mode = tt.SEND_MODE_PACED
+
+	tt.devices_alignment = args.align
+
+	# Tests if the serial port as been given as argument in the terminal
+	if(len(args.ports) == 0):
+		print('No serial port given')
+		print('To use the serial, provide the serial port as argument')
+		serial_port_given = False
+	else:
+		tt.devices = [tt.new_device(port_name) for port_name in args.ports]
+		serial_port_given = True
+
+	if(args.acquire != None):
+		if(not serial_port_given):
+			sys.exit(1)
+		output_dir = args.output_dir
+		if(output_dir == None):
+			output_dir = '.'
+		result = acquire_captures(args.acquire, args.interval, args.send, args.wait, output_dir, '.' + args.save_format)
+		if(args.profile != None):
+			quit_profiling(args.profile)
+		if(result == tt.FUNC_FAILED):
+			sys.exit(1)
+		sys.exit(0)
+
+	create_figure()
+
+	loadAx 						= plt.axes([0.12, 0.025, 0.08, 0.04])
+	saveAx 						= plt.axes([0.20, 0.025, 0.08, 0.04])
+	zoomAx 						= plt.axes([0.325, 0.025, 0.08, 0.04])
+	showAllAx 					= plt.axes([0.405, 0.025, 0.08, 0.04])
+
+	showAutoZoomAx 				= plt.axes([0.325, 0.002, 0.16, 0.02])
+
+	loadButton 					= Button(loadAx, 'Load file', color='lightblue', hovercolor='0.7')
+	saveButton					= Button(saveAx, 'Save file', color='lightblue', hovercolor='0.7')
+	zoomButton 					= Button(zoomAx, 'Time Auto zoom', color='lightblue', hovercolor='0.7')
+	showAllButton 				= Button(showAllAx, 'Show all data', color='lightblue', hovercolor='0.7')
+
+	showAutoZoomButton 			= Button(showAutoZoomAx, 'Hide auto zoom window', color='lightgreen', hovercolor='0.7')
+
+	zoomButton.on_clicked(auto_zoom_data_graph)
+	showAllButton.on_clicked(show_all_data_graph)
+	loadButton.on_clicked(lambda x: read_new_timestamps(READ_FROM_FILE))
+	saveButton.on_clicked(lambda x: write_timestamps_to_file())
+
+	showAutoZoomButton.on_clicked(lambda x: toggle_auto_zoom_window(showAutoZoomButton))
+
+	if(query != None):
+		previousResultAx 		= plt.axes([0.12, 0.002, 0.08, 0.02])
+		nextResultAx 			= plt.axes([0.20, 0.002, 0.08, 0.02])
+		previousResultButton 	= Button(previousResultAx, 'Previous result', color='lightblue', hovercolor='0.7')
+		nextResultButton 		= Button(nextResultAx, 'Next result', color='lightblue', hovercolor='0.7')
+		previousResultButton.on_clicked(lambda x: go_to_query_result(query_position - 1))
+		nextResultButton.on_clicked(lambda x: go_to_query_result(query_position + 1))
+
+	if(serial_port_given):
+		triggerAx             		= plt.axes([0.53, 0.025, 0.1, 0.04])
+		runAx             			= plt.axes([0.63, 0.025, 0.1, 0.04])
+		readAx             			= plt.axes([0.77, 0.025, 0.1, 0.04])
+		connectionAx 				= plt.axes([0.87, 0.025, 0.1, 0.04])
+		streamAx 					= plt.axes([0.77, 0.002, 0.1, 0.02])
+		progress_ax 				= plt.axes([0.53, 0.002, 0.2, 0.02], facecolor=fig.get_facecolor())
+
+		triggerButton             	= Button(triggerAx, 'Trigger', color='lightcoral', hovercolor='0.7')
+		runButton	             	= Button(runAx, 'Run', color='lightgreen', hovercolor='0.7')
+		readButton             		= Button(readAx, 'Get new data', color='lightgreen', hovercolor='0.7')
+		connectionButton 			= Button(connectionAx, 'Connect', color='lightgreen', hovercolor='0.7')
+		streamButton 				= Button(streamAx, 'Start streaming', color='lightgreen', hovercolor='0.7')
+
+		triggerButton.on_clicked(timestamps_trigger)
+		runButton.on_clicked(timestamps_run)
+		readButton.on_clicked(lambda x: read_new_timestamps(READ_FROM_SERIAL))
+		connectionButton.on_clicked(lambda x: toggle_serial(connectionButton))
+		streamButton.on_clicked(lambda x: toggle_streaming(streamButton))
+
+		# Shows what the serial worker is doing
+		progress_ax.set_xticks([])
+		progress_ax.set_yticks([])
+		for spine in progress_ax.spines.values():
+			spine.set_visible(False)
+		progress_text = progress_ax.text(0, 0.5, '', va='center', fontsize='small')
+
+		threading.Thread(target=serial_worker, daemon=True).start()
+		serial_timer = fig.canvas.new_timer(interval=SERIAL_RESULTS_TIMER_INTERVAL)
+		serial_timer.add_callback(process_serial_results)
+		serial_timer.start()
+
+	# Auto select the pan/zoom tool from the toolbar for convenience
+	plt.get_current_fig_manager().toolbar.pan()
+
+	plt.show()
+
+	# Stops the serial worker after its current job
+	streaming = False
+	serial_jobs.put(None)
+	tt.disconnect_serial()
+	if(args.profile != None):
+		quit_profiling(args.profile)
+	# Be polite, say goodbye :-)
+	print(GOODBYE)
+
+if(__name__ == '__main__'):
+	main()
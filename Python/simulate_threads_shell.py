@@ -0,0 +1,356 @@
+# File 				: simulate_threads_shell.py
+# Brief				: This script emulates the ChibiOS Shell of a mcu using the threads_timestamps
+#					  functions of threads_utilities.c on a pseudo-terminal, in order to use
+#					  plot_threads_timeline.py without a real device
+#					  The threads are scheduled randomly and the logs are recorded like the mcu does
+#					  (circular buffer, trigger, deleted threads) and printed with the same text
+#
+#					  Only works on Linux and macOS (pseudo-terminals)
+#					  To run the script : "python3 simulate_threads_shell.py"
+#					  It prints the name of the pseudo-terminal to give to plot_threads_timeline.py
+#					  Add "--baudrate 115200" to send the answers as slowly as a UART would
+
+import argparse
+import threading
+import random
+import time
+import tty
+import os
+
+SHELL_PROMPT 			= b'ch> '
+SHELL_MAX_LINE_LENGTH 	= 64 # characters of a command line, like SHELL_MAX_LINE_LENGTH of ChibiOS
+
+# Default configuration of the simulated mcu
+DEFAULT_NB_THREADS 			= 8
+DEFAULT_SWITCH_RATE 		= 5000 # context switches per second
+DEFAULT_TICK_FREQUENCY 		= 10000 # system ticks per second (CH_CFG_ST_FREQUENCY)
+DEFAULT_LOG_SIZE 			= 3000 # see THREADS_TIMESTAMPS_LOG_SIZE in threads_utilities.mk
+DEFAULT_DYNAMIC_RATE 		= 2 # creations and exits of dynamic threads per second
+DEFAULT_LOGGED_RATIO 		= 0.8 # probability for a created thread to be logged
+DEFAULT_BAUDRATE 			= 0 # 0 means no limitation
+
+# Same limits as threads_utilities.c
+MAX_REMOVED_THREADS 		= 64
+MAX_THREADS 				= 63
+TIMESTAMPS_TIME_MASK 		= 0xFFFFF
+SYSTEM_TIME_MASK 			= 0xFFFFFFFF
+
+# Threads always present on the mcu : (name, priority)
+STATIC_THREADS 				= [('main', 64), ('idle', 1), ('usb_lld_pump', 74), ('shell', 64)]
+SHELL_THREAD_NB 			= 3 # index of the shell thread in STATIC_THREADS
+EXITED_DYNAMIC_THREAD_NAME 	= 'Exited dynamic thread'
+
+BITS_PER_BYTE_SENT 			= 10 # start and stop bits of a UART
+SEND_CHUNK_DURATION 		= 0.01 # seconds of data sent at once when the baudrate is limited
+
+def new_thread(name, prio, log, dynamic):
+	return {'name': name, 'prio': prio, 'log': log, 'dynamic': dynamic}
+
+def new_mcu(nb_threads = DEFAULT_NB_THREADS, switch_rate = DEFAULT_SWITCH_RATE, tick_frequency = DEFAULT_TICK_FREQUENCY,
+			log_size = DEFAULT_LOG_SIZE, dynamic_rate = DEFAULT_DYNAMIC_RATE, seed = None):
+	# State of the simulated mcu. The logs fields have the names of the variables of threads_utilities.c
+	mcu = {'rand': random.Random(seed), 'switch_rate': switch_rate, 'tick_frequency': tick_frequency,
+			'dynamic_rate': dynamic_rate, 'boot_time': time.perf_counter(), 'time': 0, 'switches_due': 0.0,
+			'threads': [], 'current': None, 'exited': None, 'nb_created': 0,
+			'log': [(0, 0, 0)] * log_size, 'fill_pos': 0, 'full': False, 'pause': False,
+			'triggered': False, 'trigger_name': None, 'trigger_time': 0, 'fill_remaining': 0,
+			'removed': []}
+
+	for name, prio in STATIC_THREADS:
+		mcu['threads'].append(new_thread(name, prio, True, False))
+	for i in range(len(STATIC_THREADS), nb_threads):
+		create_thread(mcu, False)
+	mcu['current'] = mcu['threads'][0]
+	return mcu
+
+def create_thread(mcu, dynamic):
+	rand = mcu['rand']
+	if(len(mcu['threads']) >= MAX_THREADS):
+		return
+	mcu['nb_created'] += 1
+	name = 'Thd{}'.format(mcu['nb_created'])
+	mcu['threads'].append(new_thread(name, rand.randint(2, 127), rand.random() < DEFAULT_LOGGED_RATIO, dynamic))
+
+def continue_to_fill(mcu):
+	# See _continue_to_fill()
+	if(mcu['triggered']):
+		return mcu['fill_remaining'] > 0
+	return not mcu['pause']
+
+def increments_fill_pos(mcu):
+	# See _increments_fill_pos()
+	mcu['fill_pos'] += 1
+	if(mcu['fill_pos'] >= len(mcu['log'])):
+		mcu['fill_pos'] = 0
+		mcu['full'] = True
+	if(mcu['triggered']):
+		mcu['fill_remaining'] -= 1
+
+def add_record(mcu, thread_out, thread_in):
+	mcu['log'][mcu['fill_pos']] = (thread_out, thread_in, mcu['time'] & TIMESTAMPS_TIME_MASK)
+	increments_fill_pos(mcu)
+
+def switch_to(mcu, thread_in):
+	# See fillThreadsTimestamps()
+	thread_out = mcu['exited'] if mcu['exited'] != None else mcu['current']
+	if(continue_to_fill(mcu)):
+		# An exited thread is not in the list anymore, so its number is 0
+		nb_out = 0 if mcu['exited'] != None else mcu['threads'].index(thread_out) + 1
+		nb_in = mcu['threads'].index(thread_in) + 1
+
+		# The oldest exit record is overwritten -> this thread has no more data in the logs
+		if(mcu['full']):
+			record = mcu['log'][mcu['fill_pos']]
+			if(record[0] == record[1] and len(mcu['removed'])):
+				mcu['removed'].pop(0)
+
+		if(thread_in['log'] or thread_out['log']):
+			add_record(mcu, nb_out, nb_in)
+
+	mcu['exited'] = None
+	mcu['current'] = thread_in
+
+def exit_current_thread(mcu):
+	# See removeThread()
+	thread = mcu['current']
+	nb = mcu['threads'].index(thread) + 1
+	# Unlike the mcu, the exit is not recorded once the logs are stopped by the trigger or paused,
+	# to keep the dumps coherent
+	if(len(mcu['removed']) < MAX_REMOVED_THREADS and continue_to_fill(mcu)):
+		add_record(mcu, nb, nb)
+		if(thread['dynamic']):
+			# Only the priority and the log setting are kept for a dynamic thread
+			thread = new_thread(EXITED_DYNAMIC_THREAD_NAME, thread['prio'], thread['log'], True)
+		mcu['removed'].append((nb, thread))
+	mcu['threads'].remove(mcu['current'])
+	mcu['exited'] = mcu['current']
+
+def schedule(mcu):
+	# Chooses randomly the next thread to run (a dynamic thread can be created or exit before)
+	rand = mcu['rand']
+	probability = mcu['dynamic_rate'] / max(mcu['switch_rate'], 1)
+	current = mcu['current']
+	if(current['dynamic'] and rand.random() < probability):
+		exit_current_thread(mcu)
+	elif(rand.random() < probability):
+		create_thread(mcu, True)
+
+	candidates = [thread for thread in mcu['threads'] if thread is not current]
+	switch_to(mcu, rand.choice(candidates))
+
+def run_mcu(mcu, log = True):
+	# Runs the threads until now. If log is False, the time passes with the logs paused
+	# (like when the mcu is sending the logs)
+	now = int((time.perf_counter() - mcu['boot_time']) * mcu['tick_frequency']) & SYSTEM_TIME_MASK
+	elapsed = (now - mcu['time']) & SYSTEM_TIME_MASK
+	mcu['switches_due'] += elapsed * mcu['switch_rate'] / mcu['tick_frequency']
+	nb_switches = int(mcu['switches_due'])
+	mcu['switches_due'] -= nb_switches
+
+	if(not log):
+		mcu['time'] = now
+		return
+
+	# Only the last switches can still be in the logs, the older ones are skipped
+	if(nb_switches > 2 * len(mcu['log'])):
+		nb_switches = 2 * len(mcu['log'])
+		elapsed = min(elapsed, int(nb_switches * mcu['tick_frequency'] / mcu['switch_rate']))
+	begin = (now - elapsed) & SYSTEM_TIME_MASK
+	ticks = sorted(mcu['rand'].randint(1, max(elapsed, 1)) for i in range(nb_switches))
+	for tick in ticks:
+		mcu['time'] = (begin + tick) & SYSTEM_TIME_MASK
+		schedule(mcu)
+	mcu['time'] = now
+
+def set_trigger(mcu, name):
+	# See setTriggerTimestampsI()
+	if(not mcu['triggered']):
+		mcu['trigger_name'] = name
+		mcu['triggered'] = True
+		mcu['trigger_time'] = mcu['time']
+		if(not mcu['full'] and mcu['fill_pos'] <= len(mcu['log']) // 2):
+			mcu['fill_remaining'] = len(mcu['log']) - mcu['fill_pos']
+		else:
+			mcu['fill_remaining'] = len(mcu['log']) // 2
+	return mcu['trigger_name']
+
+def reset_trigger(mcu):
+	# See resetTriggerTimestampsI()
+	if(mcu['triggered']):
+		mcu['triggered'] = False
+		mcu['trigger_time'] = 0
+		mcu['fill_remaining'] = 0
+		mcu['fill_pos'] = 0
+		mcu['full'] = False
+		mcu['removed'] = []
+
+def thread_line(nb, thread):
+	return 'Thread number %2d : Prio = %3d, Log = %3s, Name = %s\r\n' % (nb, thread['prio'], 'Yes' if thread['log'] else 'No', thread['name'])
+
+def print_list_threads(mcu):
+	# See printListThreads()
+	text = [thread_line(nb + 1, thread) for nb, thread in enumerate(mcu['threads'])]
+	text.append('Deleted threads: \r\n')
+	text += [thread_line(nb, thread) for nb, thread in mcu['removed']]
+	return ''.join(text)
+
+def print_timestamps_lines(mcu):
+	# See printTimestampsThread(), gives the text by blocks
+	if(mcu['triggered']):
+		yield 'Triggered at %7d\r\n' % mcu['trigger_time']
+
+	if(not mcu['full']):
+		records = mcu['log'][:mcu['fill_pos']]
+	else:
+		records = mcu['log'][mcu['fill_pos']:] + mcu['log'][:mcu['fill_pos']]
+
+	for i in range(0, len(records), 1000):
+		yield ''.join(['From %2d to %2d at %7d\r\n' % record for record in records[i:i+1000]])
+
+def new_shell(fd, mcu, baudrate = DEFAULT_BAUDRATE):
+	return {'fd': fd, 'mcu': mcu, 'baudrate': baudrate, 'line': bytearray(), 'stats': []}
+
+def shell_write(shell, data):
+	# Writes to the pseudo-terminal, as slowly as the baudrate if given
+	if(shell['baudrate'] <= 0):
+		chunk_size = len(data)
+	else:
+		bytes_per_second = shell['baudrate'] / BITS_PER_BYTE_SENT
+		chunk_size = max(1, int(bytes_per_second * SEND_CHUNK_DURATION))
+
+	begin_time = time.perf_counter()
+	sent = 0
+	while(sent < len(data)):
+		sent += os.write(shell['fd'], data[sent:sent + chunk_size])
+		if(shell['baudrate'] > 0):
+			delay = begin_time + sent / bytes_per_second - time.perf_counter()
+			if(delay > 0):
+				time.sleep(delay)
+
+def execute_command(shell, command_line):
+	# Returns the answer of the Shell to the command line
+	mcu = shell['mcu']
+	args = command_line.split()
+	command = args[0]
+
+	# The shell thread runs to answer
+	run_mcu(mcu)
+	shell_thread = next(thread for thread in mcu['threads'] if thread['name'] == STATIC_THREADS[SHELL_THREAD_NB][0])
+	if(mcu['current'] is not shell_thread):
+		switch_to(mcu, shell_thread)
+
+	usage = 'Usage: {}\r\n'.format(command)
+	if(command == 'threads_list'):
+		if(len(args) > 1):
+			return usage
+		return print_list_threads(mcu)
+	elif(command == 'threads_timestamps'):
+		if(len(args) > 1):
+			return usage
+		# Sent by blocks, see shell_answer()
+		return print_timestamps_lines(mcu)
+	elif(command == 'threads_timestamps_trigger'):
+		if(len(args) > 1):
+			return usage
+		name = set_trigger(mcu, 'Shell command')
+		return 'Trigger set by %s at %7d\r\n' % (name, mcu['trigger_time'])
+	elif(command == 'threads_timestamps_run'):
+		if(len(args) > 1):
+			return usage
+		reset_trigger(mcu)
+		return 'Run mode\r\n'
+	else:
+		return command + '?\r\n'
+
+def shell_answer(shell, command_line):
+	mcu = shell['mcu']
+	begin_time = time.perf_counter()
+	answer = execute_command(shell, command_line)
+
+	nb_bytes = 0
+	if(isinstance(answer, str)):
+		answer = [answer]
+	else:
+		# The logs are paused while they are sent
+		mcu['pause'] = True
+	for text in answer:
+		data = text.encode('utf-8')
+		shell_write(shell, data)
+		nb_bytes += len(data)
+	if(mcu['pause']):
+		run_mcu(mcu, False)
+		mcu['pause'] = False
+
+	duration = time.perf_counter() - begin_time
+	shell['stats'].append({'command': command_line, 'bytes': nb_bytes, 'duration': duration})
+	print('{} : {} bytes sent in {:.3f} s'.format(command_line, nb_bytes, duration))
+
+def shell_receive(shell, data):
+	# Same behavior as shellGetLine() of ChibiOS : the characters are echoed and the line
+	# is executed when a carriage return is received
+	for char in data:
+		if(char == ord('\r')):
+			shell_write(shell, b'\r\n')
+			command_line = shell['line'].decode('utf-8', 'replace').strip()
+			shell['line'].clear()
+			if(len(command_line) > 0):
+				shell_answer(shell, command_line)
+			shell_write(shell, SHELL_PROMPT)
+		elif(char in (ord('\b'), 0x7F)):
+			if(len(shell['line']) > 0):
+				del shell['line'][-1]
+				shell_write(shell, b'\b \b')
+		# Other control characters are ignored
+		elif(char < 0x20):
+			continue
+		elif(len(shell['line']) < SHELL_MAX_LINE_LENGTH - 1):
+			shell['line'].append(char)
+			shell_write(shell, bytes([char]))
+
+def shell_loop(shell):
+	shell_write(shell, SHELL_PROMPT)
+	while(True):
+		try:
+			data = os.read(shell['fd'], 1024)
+		except OSError:
+			break
+		if(len(data) == 0):
+			break
+		shell_receive(shell, data)
+
+def open_simulator(mcu, baudrate = DEFAULT_BAUDRATE):
+	# Opens a pseudo-terminal and answers on it in a background thread
+	# Returns the name of the pseudo-terminal to connect to and the shell
+	master, slave = os.openpty()
+	# No conversion of the characters by the terminal, like a serial port
+	tty.setraw(slave)
+	shell = new_shell(master, mcu, baudrate)
+	# The slave side stays open so the simulator survives the disconnections
+	shell['slave'] = slave
+	threading.Thread(target=shell_loop, args=(shell,), daemon=True).start()
+	return os.ttyname(slave), shell
+
+def main():
+	parser = argparse.ArgumentParser(description='Emulates on a pseudo-terminal the Shell of a ChibiOS mcu using the threads_timestamps functions.')
+	parser.add_argument('--threads', type=int, default=DEFAULT_NB_THREADS, help='number of threads at the beginning')
+	parser.add_argument('--switch-rate', type=float, default=DEFAULT_SWITCH_RATE, help='context switches per second')
+	parser.add_argument('--tick-frequency', type=int, default=DEFAULT_TICK_FREQUENCY, help='system ticks per second')
+	parser.add_argument('--log-size', type=int, default=DEFAULT_LOG_SIZE, help='number of timestamps kept by the mcu')
+	parser.add_argument('--dynamic-rate', type=float, default=DEFAULT_DYNAMIC_RATE, help='creations and exits of dynamic threads per second')
+	parser.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE, help='speed of the answers in bits per second (0 for no limitation)')
+	parser.add_argument('--seed', type=int, default=None, help='seed of the random scheduling')
+	args = parser.parse_args()
+
+	mcu = new_mcu(args.threads, args.switch_rate, args.tick_frequency, args.log_size, args.dynamic_rate, args.seed)
+	port_name, shell = open_simulator(mcu, args.baudrate)
+	print('Simulated Shell ready on', port_name)
+	print('Run "python3 plot_threads_timeline.py {}" to connect to it, Ctrl+C to quit'.format(port_name))
+
+	try:
+		while(True):
+			time.sleep(1)
+	except KeyboardInterrupt:
+		pass
+
+if(__name__ == '__main__'):
+	main()
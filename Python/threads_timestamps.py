@@ -0,0 +1,1800 @@
+# File 				: threads_timestamps.py
+# Author 			: Eliot Ferragni
+# Creation date		: 3 april 2020
+# Brief				: Acquisition, parsing, processing and saving of the threads timestamps
+#					  logged by an mcu configured to use the threads_timestamp functions
+#					  in the threads_utilities.c/.h files
+#					  The parts of plot_threads_timeline.py that don't draw anything, so they can
+#					  be used by other scripts without loading matplotlib
+
+import numpy as np
+import serial
+import struct
+import json
+import gzip
+import hashlib
+import bisect
+import sys
+import time
+import os
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+NEW_RECEIVED_LINE = '> '
+SHELL_PROMPT = b'ch> '
+SHELL_ANSWER_TIMEOUT = 0.5 # seconds
+
+# ways to send a command to the Shell
+SEND_MODE_FAST 		= 0 # whole command at once, flow control with the echo
+SEND_MODE_PACED 	= 1 # character by character with a delay, for slow UART to USB bridges
+send_mode = SEND_MODE_FAST
+# number of timestamps lines parsed together while receiving them
+RECEIVE_PARSE_BATCH_LINES = 4096
+RANGE_MAX_BLOCK_SIZE = 32 # values per block of the range maximum tables
+
+FUNC_SUCCESS = True
+FUNC_FAILED = False
+
+SUBDIVISION_FACTOR_TICK_STEP 	= 2
+
+# for the extracted values fields (columns of the records structured array)
+REC_THREAD_OUT 		= 'out'
+REC_THREAD_IN		= 'in'
+REC_TIME			= 'time'
+REC_STEP 	 		= 'step'
+REC_NB_OF_STEPS 	= 'nb_of_steps'
+
+RECORDS_DTYPE = np.dtype([	(REC_THREAD_OUT, np.uint8),
+							(REC_THREAD_IN, np.uint8),
+							(REC_TIME, np.int64),
+							(REC_STEP, np.int32),
+							(REC_NB_OF_STEPS, np.int32)])
+
+# Highest number of a thread in the records, the threads after it in the list of the mcu can't be logged
+MAX_THREAD_NUMBER = np.iinfo(RECORDS_DTYPE[REC_THREAD_IN]).max
+
+# The logs only contain the 20 lower bits of the system time (see TIME_MASK in threads_utilities.c)
+TIMESTAMPS_TIME_BITS 		= 20
+TIMESTAMPS_TIME_LOOP 		= 1 << TIMESTAMPS_TIME_BITS
+
+# Layout of a "From xx to xx at xxxxxxx" line as printed by printTimestampsThread()
+TIMESTAMP_LINE_LEN 			= len('From xx to xx at xxxxxxx')
+TIMESTAMP_LINE_OUT_POS 		= (len('From '), len('From xx'))
+TIMESTAMP_LINE_IN_POS 		= (len('From xx to '), len('From xx to xx'))
+TIMESTAMP_LINE_TIME_POS 	= (len('From xx to xx at '), TIMESTAMP_LINE_LEN)
+
+# for the events of a thread (columns of the events structured array)
+# The time and the steps of an event are the ones of its record, so only its index is kept
+RAW_RECORD 			= 'record'
+RAW_IN_OUT_TYPE		= 'type'
+
+RAW_VALUES_DTYPE = np.dtype([	(RAW_RECORD, np.int32),
+								(RAW_IN_OUT_TYPE, np.uint8)])
+
+# event types stored in the RAW_IN_OUT_TYPE column
+EVENT_IN 			= 0
+EVENT_OUT 			= 1
+EVENT_EXIT 			= 2
+
+# Saved captures. The binary format is made of :
+# - CAPTURE_BINARY_MAGIC
+# - the size of the header (uint32 little endian)
+# - the header in JSON (threads_list answer, trigger time, saved position, number of records and columns)
+#   padded with spaces to align the columns
+# - the columns of the records one after the other, at the offsets given in the header
+CAPTURE_TXT_EXTENSION 		= '.txt'
+CAPTURE_TXT_GZ_EXTENSION 	= '.txt.gz'
+CAPTURE_TXT_READ_SIZE 		= 1 << 20 # characters read at once when loading a txt file
+CAPTURE_BINARY_EXTENSION 	= '.tsb'
+CAPTURE_BINARY_MAGIC 		= b'THDTSCAP'
+CAPTURE_BINARY_VERSION 		= 1
+CAPTURE_BINARY_ALIGNMENT 	= 8
+CAPTURE_BINARY_COLUMNS 		= [(REC_TIME, '<i8'), (REC_THREAD_OUT, 'u1'), (REC_THREAD_IN, 'u1')]
+CAPTURE_EXTENSIONS 			= [CAPTURE_TXT_EXTENSION, CAPTURE_TXT_GZ_EXTENSION, CAPTURE_BINARY_EXTENSION]
+
+# Cache of the processed captures of the files, to not parse them again when they are opened again.
+# A capture is found with the hash of the answers of the Shell saved in the file (the saved position excluded)
+# and is stored with its records and the intervals of its threads. The least recently used captures
+# are removed when the cache is bigger than CAPTURE_CACHE_MAX_SIZE
+CAPTURE_CACHE_VERSION 		= 2 # to change when the processing changes
+CAPTURE_CACHE_EXTENSION 	= '.npz'
+CAPTURE_CACHE_MAX_SIZE 		= 512 << 20 # bytes
+capture_cache_dir = None # no cache if None, see get_default_cache_dir()
+
+# Queries over the running slices of the threads, see query_long_slices(), query_gaps() and query_alternations()
+QUERY_TIME_TOLERANCE 		= 1e-6 # ticks, the steps being fractions of ticks the times are not exact
+
+# serial connections
+devices = [] # one per serial port given, see new_device()
+serial_connected = False
+serial_status = '' # what the acquisition in progress is doing, see set_serial_status()
+
+# alignment of the timelines when several devices are used
+ALIGN_ON_TRIGGER 	= 'trigger' # trigger times at the same place (first times for the devices without trigger)
+ALIGN_ON_START 		= 'start' # first times at the same place
+ALIGN_NONE 			= 'none' # system ticks of each device unchanged
+devices_alignment = ALIGN_ON_TRIGGER
+
+# Name given by the mcu to the dynamic threads exited (see printListThreads() in threads_utilities.c)
+EXITED_DYNAMIC_THREAD_NAME = 'Exited dynamic thread'
+
+def new_device(port_name):
+	# State of the serial connection to one mcu
+	# rx_buffer 	: bytes read from the serial but not yet given to receive_lines()
+	# receive_stats : bytes received and time spent by the last receive_lines() (or the one in progress)
+	# stream 		: streaming acquisition of the device, see new_stream()
+	return {'name': port_name, 'port': None, 'rx_buffer': bytearray([]),
+			'receive_stats': {'bytes': 0, 'duration': 0}, 'stream': None}
+
+def get_device_label(device):
+	# Short name of the device for the graph and the messages (ttyACM0 for /dev/ttyACM0 for example)
+	return os.path.basename(device['name'])
+
+def close_ports():
+	for device in devices:
+		if(device['port'] != None):
+			device['port'].close()
+			device['port'] = None
+
+def connect_serial():
+	global serial_connected
+
+	if(not serial_connected):
+		for device in devices:
+			try:
+				print('Connecting to port {}'.format(device['name']))
+				device['port'] = serial.Serial(device['name'], timeout=0.1)
+			except:
+				print('Cannot connect to the device')
+				# Connected to all the devices or to none
+				close_ports()
+				serial_connected = False
+				return FUNC_FAILED
+		serial_connected = True
+
+	print('Connected')
+	return FUNC_SUCCESS
+
+def disconnect_serial():
+	global serial_connected
+
+	if(not serial_connected):
+		print('Already disconnected')
+	else:
+		close_ports()
+		serial_connected = False
+		print('Disconnected')
+
+def run_on_devices(function):
+	# Calls function(device) for all the devices at the same time, each one in its own thread
+	# Returns the results in the order of the devices
+	if(len(devices) == 1):
+		return [function(devices[0])]
+	with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+		return list(executor.map(function, devices))
+
+def read_serial_until(device, condition, timeout):
+	# Reads the serial into the rx_buffer of the device until condition(rx_buffer) is True
+	# Returns False if the timeout (in seconds) has been reached before
+	port = device['port']
+	rx_buffer = device['rx_buffer']
+	end_time = time.perf_counter() + timeout
+	while(not condition(rx_buffer)):
+		if(time.perf_counter() > end_time):
+			return False
+		rx_buffer.extend(port.read(max(1, port.in_waiting)))
+	return True
+
+def flush_shell(device):
+	# In case there was a communication problem
+	# we send two return commands to trigger the sending of 
+	# a new command line from the Shell (to begin from the beginning)
+	port = device['port']
+	port.write(b'\r\n')
+	port.write(b'\r\n')
+
+	if(send_mode == SEND_MODE_PACED):
+		time.sleep(0.1)
+	else:
+		# Waits for the two new command lines instead of a fixed time
+		read_serial_until(device, lambda rcv: rcv.count(SHELL_PROMPT) >= 2 and rcv.endswith(SHELL_PROMPT), SHELL_ANSWER_TIMEOUT)
+
+	# Flushes the input
+	device['rx_buffer'].clear()
+	while(port.in_waiting):
+		port.read(port.in_waiting)
+
+def send_command_paced(device, command):
+	# We send the command character by character with a small delay
+	# because some UART to USB bridges could miss one if sent to quickly
+	for char in command: 
+		device['port'].write(char.encode('utf-8'))
+		time.sleep(0.001)
+
+def type_command(device, command):
+	# Sends the command without the return, so it is not executed yet
+	if(send_mode == SEND_MODE_FAST):
+		# We send the whole command at once and use the echo of the Shell as flow control :
+		# the return is only sent once every character has been echoed
+		port = device['port']
+		rx_buffer = device['rx_buffer']
+		encoded_command = command.encode('utf-8')
+		echo_begin = len(rx_buffer)
+		port.write(encoded_command)
+		if(read_serial_until(device, lambda rcv: len(rcv) - echo_begin >= len(encoded_command), SHELL_ANSWER_TIMEOUT)
+			and rx_buffer[echo_begin:] == encoded_command):
+			return
+
+		# Some characters have been lost on the way
+		# -> erases what has been received by the Shell and sends again with the slow method
+		print('Bad echo received, sending the command again character by character')
+		port.write(b'\b' * (len(rx_buffer) - echo_begin))
+
+		# Flushes the garbled echo and the echo of the erasing, otherwise they would be
+		# read as the beginning of the answer
+		time.sleep(0.1)
+		rx_buffer.clear()
+		while(port.in_waiting):
+			port.read(port.in_waiting)
+
+	send_command_paced(device, command)
+
+def send_command(device, command, echo):
+	if(echo == True):
+		print('Sent :',command)
+
+	type_command(device, command)
+
+	# A command should finish by a return, otherwise nothing happens
+	if(send_mode == SEND_MODE_FAST):
+		device['port'].write(b'\r\n')
+	else:
+		send_command_paced(device, '\r\n')
+
+def broadcast_command(command, echo):
+	# Sends the command to all the devices. The command is typed on each one first,
+	# then the returns are sent one right after the other so the devices execute it
+	# as simultaneously as possible (for the trigger)
+	if(echo == True):
+		print('Sent :',command)
+
+	for device in devices:
+		type_command(device, command)
+	for device in devices:
+		device['port'].write(b'\r\n')
+
+def receive_lines(device, echo):
+	# Generator giving the received lines by batches, as soon as they are complete,
+	# in order to be able to process them while the rest is still being transferred
+	# Begins with what has already been read (the echo of the command for example)
+	port = device['port']
+	rcv = bytearray(device['rx_buffer'])
+	device['rx_buffer'].clear()
+	nb_bytes = len(rcv)
+	begin_time = time.perf_counter()
+	device['receive_stats']['bytes'] = nb_bytes
+	device['receive_stats']['duration'] = 0
+
+	if(echo == True):
+		print('Received:')
+
+	# We read until the end of the transmission found by searching 
+	# the beginning of a new command line "ch> " from the Shell
+	while(True):
+		# Reads everything already waiting, or blocks until one byte comes (or the timeout)
+		chunk = port.read(max(1, port.in_waiting))
+		if(len(chunk) == 0):
+			continue
+		nb_bytes += len(chunk)
+		rcv += chunk
+		# Updated at each chunk for the progress of the transfer shown by the GUI
+		device['receive_stats']['bytes'] = nb_bytes
+		device['receive_stats']['duration'] = time.perf_counter() - begin_time
+
+		# Splits the complete lines as we would see them on a terminal
+		# Only the beginning of the last line stays in the buffer
+		end = rcv.rfind(b'\r\n')
+		if(end >= 0):
+			text_lines = rcv[:end].decode("utf-8").split('\r\n')
+			del rcv[:end + len(b'\r\n')]
+			if(echo == True):
+				for line in text_lines:
+					print(NEW_RECEIVED_LINE, line)
+			yield text_lines
+
+		# The prompt is never followed by a return so it is necessarily
+		# at the end of the incomplete line
+		if(rcv.endswith(SHELL_PROMPT)):
+			break
+
+	device['receive_stats']['bytes'] = nb_bytes
+	device['receive_stats']['duration'] = time.perf_counter() - begin_time
+
+	text_lines = [rcv.decode("utf-8")]
+	if(echo == True):
+		print(NEW_RECEIVED_LINE, text_lines[0])
+	yield text_lines
+
+def receive_text(device, echo):
+	text_lines = []
+	for new_lines in receive_lines(device, echo):
+		text_lines += new_lines
+
+	return text_lines
+
+def print_receive_rate(device):
+	receive_stats = device['receive_stats']
+	duration = receive_stats['duration']
+	if(duration > 0):
+		# Tells which device if there are several
+		prefix = ''
+		if(len(devices) > 1):
+			prefix = get_device_label(device) + ' : '
+		print('{}Received {} bytes in {:.2f} s ({:.0f} bytes/s)'.format(prefix, receive_stats['bytes'], duration, receive_stats['bytes']/duration))
+
+def receive_timestamps(device):
+	# Receives the answer of the command "threads_timestamps" and parses the timestamps lines
+	# by batches during the transfer
+	# Returns the received lines and the parsed records (None if some lines are corrupted)
+	text_lines = []
+	records_batches = []
+	first_data_line = None
+	next_line = None
+	corrupted = False
+
+	for new_lines in receive_lines(device, False):
+		text_lines += new_lines
+		if(first_data_line is None and len(text_lines) > 2):
+			# One more line if the trigger mode is enabled, see process_threads_timestamps_cmd()
+			if(text_lines[1][:len('Triggered at ')] == 'Triggered at '):
+				first_data_line = 2
+			else:
+				first_data_line = 1
+			next_line = first_data_line
+		# The last line received could be the prompt, so it is kept for later
+		if(not corrupted and next_line is not None and len(text_lines) - 1 - next_line >= RECEIVE_PARSE_BATCH_LINES):
+			batch = parse_timestamps_lines(text_lines[next_line:len(text_lines)-1])
+			next_line = len(text_lines) - 1
+			if(batch is None):
+				corrupted = True
+			else:
+				records_batches.append(batch)
+
+	print_receive_rate(device)
+
+	if(corrupted or next_line is None):
+		return text_lines, None
+
+	batch = parse_timestamps_lines(text_lines[next_line:len(text_lines)-1])
+	if(batch is None):
+		return text_lines, None
+	records_batches.append(batch)
+
+	return text_lines, np.concatenate(records_batches)
+
+def empty_intervals():
+	return np.empty((0, 2), dtype=np.float64)
+
+def append_thread(thread_list, name, nb, prio, log):
+
+	# The intervals are stored as (begin, width) rows, the format used by broken_barh
+	if(log == 'Yes'):	
+		# Adds a logged thread to the threads list
+		thread_list.append({'name': name,'nb': nb,'prio': prio,'log': True, 'have_values': False, 
+							'values': empty_intervals(), 'exit_value': empty_intervals(), 'no_data': empty_intervals()})
+	else:
+		# Adds a non logged thread to the threads list
+		thread_list.append({'name': name,'nb': nb,'prio': prio,'log': False, 'have_values': False, 
+							'in_values': empty_intervals(),'out_values': empty_intervals(), 'exit_value': empty_intervals(), 'no_data': empty_intervals()})
+
+
+def process_threads_list_cmd(lines, thread_list, deleted_list = None):
+	# What we should receive :
+	# line 0 			: threads_list
+	# line 1 -> n-1 	: Thread number xx : Prio = xxx, Log = xxx, Name = str
+	# line n			: ch>
+	# The threads are added to thread_list. If deleted_list is given, the deleted threads
+	# are added to it instead, in the order they have been deleted
+
+	deleted_threads = []
+	deleted = False
+	
+	# If the received text doesn't match what we expect, print it and quit
+	if(lines[1][:len('Thread number')] != 'Thread number'):
+		print('Bad answer received, see below :')
+		for line in lines:
+			print(NEW_RECEIVED_LINE, line)
+		return FUNC_FAILED
+
+	for i in range(1,len(lines)-1):
+		if(not deleted and lines[i] == 'Deleted threads: '):
+			deleted = True
+			continue
+		nb 		= int(lines[i][len('Thread number '):len('Thread number ')+2])
+		prio 	= int(lines[i][len('Thread number xx : Prio = '):len('Thread number xx : Prio = ')+3])
+		log 	= lines[i][len('Thread number xx : Prio = xxx, Log = '):len('Thread number xx : Prio = xxx, Log = ')+3]
+		name 	= lines[i][len('Thread number xx : Prio = xxx, Log = xxx, Name = '):]
+
+		if(deleted):
+			append_thread(deleted_threads, name, nb, prio, log)
+		else:
+			append_thread(thread_list, name, nb, prio, log)
+
+
+	if(deleted_list is not None):
+		deleted_list += deleted_threads
+		return FUNC_SUCCESS
+
+	# The deleted threads are given in the order they have been deleted
+	# and the number they have was the thread number at the time they existed
+	# -> By inserting them to the threads list in the reverse order at their old position, 
+	# 	 we recover the original threads creation order
+	while(len(deleted_threads)):
+		thread_list.insert(deleted_threads[-1]['nb']-1, deleted_threads.pop(-1))
+
+	return FUNC_SUCCESS
+
+
+def parse_fixed_width_column(chars, begin, end):
+	# Converts the columns [begin, end[ of a matrix of ASCII digits (one line per row)
+	# into integers. The spaces used as padding by chprintf count as zeros
+	digits = chars[:, begin:end].astype(np.int64) - ord('0')
+	digits[digits == ord(' ') - ord('0')] = 0
+	if(np.any((digits < 0) | (digits > 9))):
+		return None
+	return digits @ (10 ** np.arange(end - begin - 1, -1, -1, dtype=np.int64))
+
+def parse_timestamps_lines(lines):
+	# Converts a list of "From xx to xx at xxxxxxx" lines into a records array
+	# Returns None if a line doesn't have the expected format
+	nb_records = len(lines)
+	records = np.zeros(nb_records, dtype=RECORDS_DTYPE)
+	if(nb_records == 0):
+		return records
+
+	# Fast path : every line has the fixed width given by printTimestampsThread()
+	# so the whole dump can be seen as a matrix of characters
+	text = ''.join(lines).encode('utf-8', errors='replace')
+	if(len(text) == nb_records * TIMESTAMP_LINE_LEN):
+		chars = np.frombuffer(text, dtype=np.uint8).reshape(nb_records, TIMESTAMP_LINE_LEN)
+		# The constant parts of the lines must be there
+		template = np.frombuffer(b'From xx to xx at xxxxxxx', dtype=np.uint8)
+		constant = template != ord('x')
+		if(np.all(chars[:, constant] == template[constant])):
+			thread_out 	= parse_fixed_width_column(chars, *TIMESTAMP_LINE_OUT_POS)
+			thread_in 	= parse_fixed_width_column(chars, *TIMESTAMP_LINE_IN_POS)
+			time 		= parse_fixed_width_column(chars, *TIMESTAMP_LINE_TIME_POS)
+			if(thread_out is not None and thread_in is not None and time is not None):
+				records[REC_THREAD_OUT] = thread_out
+				records[REC_THREAD_IN] 	= thread_in
+				records[REC_TIME] 		= time
+				return records
+
+	# Slow path : lines with a variable width (for example times bigger than 7 digits)
+	# Every line gives 6 words : From, xx, to, xx, at, xxxxxxx
+	words = ' '.join(lines).split()
+	if(len(words) != 6 * nb_records or words[0::6].count('From') != nb_records
+		or words[2::6].count('to') != nb_records or words[4::6].count('at') != nb_records):
+		return None
+	try:
+		thread_out 	= np.array(words[1::6], dtype=np.int64)
+		thread_in 	= np.array(words[3::6], dtype=np.int64)
+		time 		= np.array(words[5::6], dtype=np.int64)
+	except (ValueError, OverflowError):
+		return None
+	# The numbers of the threads would be wrapped into the uint8 columns otherwise
+	for numbers in (thread_out, thread_in):
+		if(np.any(numbers < 0) or np.any(numbers > MAX_THREAD_NUMBER)):
+			return None
+	records[REC_THREAD_OUT] = thread_out
+	records[REC_THREAD_IN] 	= thread_in
+	records[REC_TIME] 		= time
+
+	return records
+
+def compute_records_steps(records):
+	# Several context switches can happen during the same system tick. They are
+	# numbered (step) and counted (nb_of_steps) in order to subdivide the tick on the timeline
+	# -> Run-length grouping of the consecutive records having the same time
+	nb_records = len(records)
+	if(nb_records == 0):
+		return
+	times = records[REC_TIME]
+	new_group = np.empty(nb_records, dtype=bool)
+	new_group[0] = True
+	np.not_equal(times[1:], times[:-1], out=new_group[1:])
+	group_begins = np.flatnonzero(new_group)
+	group_sizes = np.diff(np.append(group_begins, nb_records))
+
+	records[REC_NB_OF_STEPS] = np.repeat(group_sizes, group_sizes)
+	records[REC_STEP] = np.arange(nb_records) - np.repeat(group_begins, group_sizes)
+
+def build_range_max_table(values):
+	# Sparse table of the maximum of the values for any range, to answer in constant time
+	# the maximum of a part of the records. To keep it small, the table is built over the
+	# maximum of each block of RANGE_MAX_BLOCK_SIZE values, the values of the incomplete
+	# blocks at the ends of a range being read directly
+	nb_blocks = -(-len(values) // RANGE_MAX_BLOCK_SIZE)
+	padded = np.zeros(nb_blocks * RANGE_MAX_BLOCK_SIZE, dtype=values.dtype)
+	padded[0:len(values)] = values
+	if(len(values) > 0):
+		padded[len(values):] = values.min()
+
+	# levels[k][i] is the maximum of the blocks i to i + 2^k - 1
+	levels = [padded.reshape(nb_blocks, RANGE_MAX_BLOCK_SIZE).max(axis=1, initial=0)]
+	width = 1
+	while(2 * width <= nb_blocks):
+		levels.append(np.maximum(levels[-1][:-width], levels[-1][width:]))
+		width *= 2
+
+	return {'values': values, 'levels': levels}
+
+def query_range_max(table, first, last):
+	# Returns the maximum of values[first:last] or None if the range is empty
+	# The indexes often come from np.searchsorted, the numpy integers don't have bit_length()
+	first = int(first)
+	last = int(last)
+	if(first >= last):
+		return None
+	values = table['values']
+	first_block = -(-first // RANGE_MAX_BLOCK_SIZE)
+	last_block = last // RANGE_MAX_BLOCK_SIZE
+	if(first_block >= last_block):
+		return int(values[first:last].max())
+
+	# Incomplete blocks at the ends
+	result = values[first:first_block*RANGE_MAX_BLOCK_SIZE].max(initial=0)
+	result = max(result, values[last_block*RANGE_MAX_BLOCK_SIZE:last].max(initial=0))
+
+	# Complete blocks, covered by two overlapping ranges of 2^k blocks
+	k = (last_block - first_block).bit_length() - 1
+	level = table['levels'][k]
+	result = max(result, level[first_block], level[last_block - (1 << k)])
+	return int(result)
+
+def get_records_range(records, begin, end):
+	# Returns the indexes first, last of the records between begin and end included
+	# The records are sorted by time
+	first = np.searchsorted(records[REC_TIME], begin, side='left')
+	last = np.searchsorted(records[REC_TIME], end, side='right')
+	return first, last
+
+def dispatch_records_to_threads(records, thread_list):
+	# Converts every record into one or two events (OUT or EXIT of a thread, IN of another one)
+	# and returns the events of each thread of thread_list, as raw_values arrays sorted by time
+	nb_records = len(records)
+	thread_out 	= records[REC_THREAD_OUT].astype(np.int64)
+	thread_in 	= records[REC_THREAD_IN].astype(np.int64)
+
+	# A thread has been deleted when the OUT and IN threads are the same
+	exits = np.flatnonzero(thread_out == thread_in)
+
+	# Index in the threads list of the thread concerned by each event, -1 if none
+	# A long stream can gather more threads than an int16 can count
+	owner_dtype = np.int16 if len(thread_list) < np.iinfo(np.int16).max else np.int32
+	out_owner 	= np.full(nb_records, -1, dtype=owner_dtype)
+	in_owner 	= np.full(nb_records, -1, dtype=owner_dtype)
+
+	# The MCU numbers the threads with their position in the list of the alive threads
+	# We simulate the deletions to be coherent with the numbering of the timestamps.
+	# The numbering only changes after a deletion so the translation is done
+	# with a lookup table for each segment of records between two deletions
+	alive = list(range(len(thread_list)))
+	segments_alive = []
+	lookup = np.full(MAX_THREAD_NUMBER + 1, -1, dtype=owner_dtype)
+	segment_begin = 0
+	for segment_end in exits.tolist() + [nb_records - 1]:
+		# Only the first threads have a number (a stream lists every thread seen since its beginning)
+		segment_alive = alive[:MAX_THREAD_NUMBER]
+		segments_alive.append(segment_alive)
+		lookup[:] = -1
+		lookup[1:len(segment_alive)+1] = segment_alive
+		# The line after a thread deletion contains a 0 because the out thread doesn't exist anymore
+		# -> ignores the OUT because written as an EXIT with the deletion
+		segment = slice(segment_begin, segment_end + 1)
+		out_owner[segment] 	= lookup[thread_out[segment]]
+		in_owner[segment] 	= lookup[thread_in[segment]]
+
+		number = int(thread_out[segment_end])
+		if(thread_out[segment_end] == thread_in[segment_end] and 1 <= number <= len(alive)):
+			alive.pop(number-1)
+		segment_begin = segment_end + 1
+
+	# The deletion is only an EXIT event for the deleted thread
+	in_owner[exits] = -1
+
+	# Number of each thread in each segment (0 once deleted), to find later the threads of a record
+	# without keeping the owners of the records, see get_numbered_thread()
+	numbers = np.zeros((len(thread_list), len(segments_alive)), dtype=np.uint8)
+	for segment, segment_alive in enumerate(segments_alive):
+		numbers[segment_alive, segment] = np.arange(1, len(segment_alive) + 1)
+	for i, thread in enumerate(thread_list):
+		thread['numbers'] = numbers[i]
+
+	# Interleaves the two events of each record to keep them ordered by time
+	owner 		= np.empty(2*nb_records, dtype=owner_dtype)
+	owner[0::2] = out_owner
+	owner[1::2] = in_owner
+
+	events = np.empty(2*nb_records, dtype=RAW_VALUES_DTYPE)
+	events[RAW_RECORD] = np.arange(2*nb_records, dtype=np.int32) >> 1
+	event_type = np.empty(2*nb_records, dtype=np.uint8)
+	event_type[0::2] = EVENT_OUT
+	event_type[1::2] = EVENT_IN
+	event_type[2*exits] = EVENT_EXIT
+	events[RAW_IN_OUT_TYPE] = event_type
+
+	valid 	= owner >= 0
+	owner 	= owner[valid]
+	events 	= events[valid]
+
+	# Groups the events by thread. The stable sort keeps the time order inside each group
+	order 	= np.argsort(owner, kind='stable')
+	bounds 	= np.concatenate(([0], np.cumsum(np.bincount(owner, minlength=len(thread_list)))))
+	events 	= events[order]
+	return [events[bounds[i]:bounds[i+1]] for i in range(len(thread_list))]
+
+def get_events_values(records, raw_values):
+	# Returns the type, the time, the step and the number of steps of each event
+	index = raw_values[RAW_RECORD]
+	return (raw_values[RAW_IN_OUT_TYPE], records[REC_TIME][index], 
+			records[REC_STEP][index], records[REC_NB_OF_STEPS][index])
+
+def get_records_exits(records):
+	# Indexes of the records deleting a thread, after which the threads are numbered differently
+	return np.flatnonzero(records[REC_THREAD_OUT] == records[REC_THREAD_IN])
+
+def get_numbered_thread(thread_list, exits, index, number):
+	# Returns the thread of thread_list having the number given by the mcu in the record index
+	# or None. exits is given by get_records_exits()
+	if(number == 0):
+		return None
+	segment = np.searchsorted(exits, index, side='left')
+	for thread in thread_list:
+		if(thread['numbers'][segment] == number):
+			return thread
+	return None
+
+def get_record_index(records, position):
+	# Returns the index of the record drawn at position (its time plus its step divided
+	# by its number of steps, see build_logged_thread_intervals()) or None
+	# np.searchsorted would copy the time column since it isn't aligned in the records
+	# The binary search of bisect reads only the few records it compares
+	time = int(np.floor(position))
+	first = bisect.bisect_left(records[REC_TIME], time)
+	if(first >= len(records) or records[REC_TIME][first] != time):
+		return None
+	nb_of_steps = int(records[REC_NB_OF_STEPS][first])
+	step = int(round((position - time) * nb_of_steps))
+	return first + min(step, nb_of_steps - 1)
+
+def build_logged_thread_intervals(thread, records, raw_values, first_time, last_time):
+	event_type, time, step_nb, nb_of_steps = get_events_values(records, raw_values)
+
+	if(event_type[0] == EVENT_OUT):
+		if(time[0] == 0):
+			# Insert an IN time in case the first we encounter is an out time and time is 0
+			# Happens with the main thread that has no IN time at boot 
+			# (no context switch to main since it's the first thread to begin)
+			event_type 	= np.concatenate(([EVENT_IN], event_type))
+			time 		= np.concatenate(([0], time))
+			step_nb 	= np.concatenate(([0], step_nb))
+			nb_of_steps = np.concatenate(([1], nb_of_steps))
+
+	# Takes the values by pair, an IN time followed by an OUT or EXIT time
+	# The values without pair are ignored to not mess the timeline. It is the case of
+	# a first OUT time, a last IN time or the ones around the data lost by a stitched capture
+	pairs = np.flatnonzero((event_type[:-1] == EVENT_IN) & (event_type[1:] != EVENT_IN))
+
+	step = 1/nb_of_steps[pairs]
+	shift = step_nb[pairs] * step
+	begin = time[pairs] + shift
+	width = (time[pairs + 1] - time[pairs]) - shift
+
+	short = width < 1
+	width[short] = step[short]
+
+	thread['values'] = np.column_stack((begin, width))
+
+	if(len(begin) > 0):
+		# Draws a no data area to show where the first data is on the timeline
+		thread['no_data'] = np.array([(first_time, begin[0] - first_time)], dtype=np.float64)
+
+		# Also draw something when we exit a thread
+		exited = event_type[pairs + 1] == EVENT_EXIT
+		exit_begin = begin[exited] + step[exited]
+		thread['exit_value'] = np.column_stack((exit_begin, last_time - exit_begin))
+
+		# Indicates we have timestamps to draw
+		thread['have_values'] = True
+
+def build_not_logged_thread_intervals(thread, records, raw_values, first_time, last_time):
+	event_type, time, step_nb, nb_of_steps = get_events_values(records, raw_values)
+
+	step = 1/nb_of_steps
+	# size of an IN or OUT tick (for incomplete data)
+	tick_step = step/SUBDIVISION_FACTOR_TICK_STEP
+	shift = step_nb * step
+	begin = time + shift
+
+	is_in 	= event_type == EVENT_IN
+	is_out 	= event_type == EVENT_OUT
+	is_exit = event_type == EVENT_EXIT
+
+	thread['in_values'] 	= np.column_stack((begin[is_in], tick_step[is_in]))
+	thread['out_values'] 	= np.column_stack((begin[is_out] - tick_step[is_out], tick_step[is_out]))
+
+	# For incomplete data, exiting a thread is drawn the same as an OUT time
+	# except for the color
+	exit_begin = begin[is_exit] - tick_step[is_exit]
+	thread['exit_value'] = np.column_stack((exit_begin, last_time - exit_begin))
+
+	# Draws a no data area to show where the first data is on the timeline
+	thread['no_data'] = np.array([(first_time, begin[0] - first_time)], dtype=np.float64)
+
+	# Indicates if we have timestamps to draw
+	if((len(thread['in_values']) > 0) or (len(thread['out_values']) > 0)):
+		thread['have_values'] = True
+
+def unwrap_times(times):
+	# The mcu only logs 20 bits of the system time so the times loop every 2^20 ticks
+	# Each time going backward means we looped once more
+	# Returns the times converted into a monotonic time base beginning with the first time
+	times = np.asarray(times, dtype=np.int64)
+	nb_loops = np.zeros(len(times), dtype=np.int64)
+	if(len(times) > 1):
+		np.cumsum(times[1:] < times[:-1], out=nb_loops[1:])
+	return times + nb_loops * TIMESTAMPS_TIME_LOOP
+
+def unwrap_trigger_time(trigger, times):
+	# The trigger time is printed with all the bits of the system time
+	# -> Takes the value equal modulo 2^20 the closest to the unwrapped times
+	first = int(times[0])
+	last = int(times[-1])
+	candidate = first - first % TIMESTAMPS_TIME_LOOP + trigger % TIMESTAMPS_TIME_LOOP
+	candidates = [candidate - TIMESTAMPS_TIME_LOOP, candidate, candidate + TIMESTAMPS_TIME_LOOP]
+	return min(candidates, key=lambda t: max(first - t, t - last, 0))
+
+def parse_threads_timestamps_cmd(lines, parsed_records = None):
+	# parsed_records can be given if the timestamps lines have already been parsed
+	# (while receiving them for example)
+	# Returns the trigger time, the records with unwrapped times and the result
+	
+	# What we should receive (one more line if the trigger mode is enabled) :
+	# line 0 			: threads_timestamps
+	# (line 1)			: Triggered at xxxxxxx
+	# line 1 (2) -> n-1 : From xx to xx at xxxxxxx
+	# line n			: ch>
+
+	first_data_line = 1
+
+	# Gets the trigger time if any
+	if(lines[first_data_line][:len('Triggered at ')] == 'Triggered at '):
+		trigger = int(lines[first_data_line][len('Triggered at '):])
+		first_data_line = 2
+	# No trigger
+	else:
+		trigger = None
+
+	# If the received text doesn't match what we expect, print it and quit
+	if(lines[first_data_line][:len('From ')] != 'From '):
+		print('Bad answer received, see below :')
+		for line in lines:
+			print(NEW_RECEIVED_LINE, line)
+		return 0, None, FUNC_FAILED
+
+	if(parsed_records is not None):
+		new_records = parsed_records
+	else:
+		new_records = parse_timestamps_lines(lines[first_data_line:len(lines)-1])
+	if(new_records is None):
+		print('Bad answer received, some timestamps lines are corrupted')
+		return 0, None, FUNC_FAILED
+
+	new_records[REC_TIME] = unwrap_times(new_records[REC_TIME])
+	if(trigger != None):
+		trigger = unwrap_trigger_time(trigger, new_records[REC_TIME])
+
+	return trigger, new_records, FUNC_SUCCESS
+
+def process_records(records, thread_list):
+	# Builds the intervals to draw of the threads from the records
+	compute_records_steps(records)
+
+	# The events are only needed to build the intervals, they are not kept in the threads
+	threads_raw_values = dispatch_records_to_threads(records, thread_list)
+
+	first_time 	= int(records[0][REC_TIME])
+	last_time 	= int(records[-1][REC_TIME])
+	for thread, raw_values in zip(thread_list, threads_raw_values):
+		if(len(raw_values) > 0):
+			# Thread logged by the MCU
+			if(thread['log']):
+				build_logged_thread_intervals(thread, records, raw_values, first_time, last_time)
+			# Thread not logged by the MCU
+			else:
+				build_not_logged_thread_intervals(thread, records, raw_values, first_time, last_time)
+
+def process_threads_timestamps_cmd(lines, thread_list, parsed_records = None):
+	# Returns the trigger time, the records and the result
+	trigger, records, result = parse_threads_timestamps_cmd(lines, parsed_records)
+	if(result == FUNC_FAILED):
+		return 0, None, FUNC_FAILED
+
+	process_records(records, thread_list)
+
+	return trigger, records, FUNC_SUCCESS
+
+def build_capture(lines_list, lines_data, parsed_records = None, lines_pos = None):
+	# Processes the answers of the Shell into a capture ready to be drawn
+	# Returns None if the answers are not valid
+	capture_threads = []
+	if(process_threads_list_cmd(lines_list, capture_threads) == FUNC_FAILED):
+		return None
+
+	trigger, capture_records, result = process_threads_timestamps_cmd(lines_data, capture_threads, parsed_records)
+	if(result == FUNC_FAILED):
+		return None
+
+	return make_capture(capture_threads, capture_records, trigger, lines_list, lines_data, lines_pos)
+
+def build_capture_from_records(lines_list, records, trigger, lines_pos = None):
+	# Same as build_capture() but with records already parsed and unwrapped (binary files)
+	# There are no timestamps lines in this case, they are written from the records if needed
+	capture_threads = []
+	if(process_threads_list_cmd(lines_list, capture_threads) == FUNC_FAILED):
+		return None
+
+	process_records(records, capture_threads)
+
+	return make_capture(capture_threads, records, trigger, lines_list, [], lines_pos)
+
+def make_capture(capture_threads, capture_records, trigger, lines_list, lines_data, lines_pos):
+	sort_threads_by_prio(capture_threads)
+
+	return {'threads': capture_threads, 'records': capture_records, 'trigger': trigger,
+			'steps_table': build_range_max_table(capture_records[REC_NB_OF_STEPS]),
+			'lines_list': lines_list, 'lines_data': lines_data, 'lines_pos': lines_pos}
+
+def records_to_timestamps_lines(records, trigger):
+	# Writes the records as the answer of the Shell to the threads_timestamps command
+	# The times are unwrapped, so they can be wider than what the mcu prints
+	lines_data = ['threads_timestamps']
+	if(trigger != None):
+		lines_data.append('Triggered at %7d' % trigger)
+	lines_data += ['From %2d to %2d at %7d' % record for record in zip(records[REC_THREAD_OUT].tolist(),
+						records[REC_THREAD_IN].tolist(), records[REC_TIME].tolist())]
+	lines_data.append('ch> ')
+	return lines_data
+
+def shift_thread_times(thread, offset):
+	# Returns a copy of the thread with its times shifted by offset
+	thread = dict(thread)
+	for key in ('values', 'in_values', 'out_values', 'exit_value', 'no_data'):
+		if(key in thread):
+			thread[key] = thread[key] + [offset, 0]
+	return thread
+
+def get_devices_offsets(captures):
+	# Returns the offset to add to the times of each capture to align them with the first one
+	reference = captures[0]
+	offsets = []
+	for capture in captures:
+		if(devices_alignment == ALIGN_NONE):
+			offsets.append(0)
+		elif(devices_alignment == ALIGN_ON_TRIGGER and reference['trigger'] != None and capture['trigger'] != None):
+			offsets.append(reference['trigger'] - capture['trigger'])
+		else:
+			offsets.append(int(reference['records'][0][REC_TIME]) - int(capture['records'][0][REC_TIME]))
+	return offsets
+
+def merge_devices_captures(captures):
+	# Gathers the captures of the devices (in the order of the devices) into one capture
+	# Each device has its own group of threads and the times are aligned with devices_alignment
+	# The captures of the devices are kept in 'devices' with their offset
+	if(len(devices) == 1):
+		return captures[0]
+
+	valid = []
+	for device, capture in zip(devices, captures):
+		if(capture == None):
+			print('No valid data received from', get_device_label(device))
+		else:
+			valid.append((device, capture))
+	if(len(valid) == 0):
+		return None
+
+	offsets = get_devices_offsets([capture for device, capture in valid])
+	merged_threads = []
+	merged_records = []
+	merged_devices = []
+	trigger = None
+	for (device, capture), offset in zip(valid, offsets):
+		for thread in capture['threads']:
+			thread = shift_thread_times(thread, offset)
+			thread['device'] = get_device_label(device)
+			merged_threads.append(thread)
+		device_records = capture['records'].copy()
+		device_records[REC_TIME] += offset
+		merged_records.append(device_records)
+		# The trigger bar is drawn at the first trigger
+		if(trigger == None and capture['trigger'] != None):
+			trigger = capture['trigger'] + offset
+		merged_devices.append({'name': get_device_label(device), 'capture': capture, 'offset': offset})
+		print('{} : {} timestamps, shifted by {} ticks'.format(get_device_label(device), len(capture['records']), offset))
+
+	# The records of all the devices sorted by time, for the auto zoom
+	merged_records = np.concatenate(merged_records)
+	merged_records = merged_records[np.argsort(merged_records[REC_TIME], kind='stable')]
+
+	return {'threads': merged_threads, 'records': merged_records, 'trigger': trigger,
+			'steps_table': build_range_max_table(merged_records[REC_NB_OF_STEPS]),
+			'lines_list': [], 'lines_data': [], 'lines_pos': None, 'devices': merged_devices}
+
+def build_intervals_index(intervals):
+	# Sorted endpoints of (begin, width) rows sorted by begin. The ends are only sorted if
+	# the intervals don't overlap, so their running maximum is kept to find the intervals of a range
+	begins = intervals[:, 0]
+	ends = begins + intervals[:, 1]
+	return {'begins': begins, 'widths': intervals[:, 1], 'ends': ends, 'max_ends': np.maximum.accumulate(ends)}
+
+def get_intervals_range(index, begin, end):
+	# Index of the first and last+1 intervals overlapping [begin, end]
+	first = np.searchsorted(index['max_ends'], begin, side='right')
+	last = np.searchsorted(index['begins'], end, side='left')
+	return first, max(first, last)
+
+def get_thread_slices(thread):
+	# Returns the times during which the thread was running as (begin, width) rows
+	# Only the IN and OUT ticks of the not logged threads are known, an IN tick followed
+	# by an OUT tick gives a slice from the beginning of the first to the end of the second
+	if(thread['log']):
+		return thread['values']
+	begins = thread['in_values'][:, 0]
+	out_ends = thread['out_values'][:, 0] + thread['out_values'][:, 1]
+	if(len(begins) == 0 or len(out_ends) == 0):
+		return empty_intervals()
+	next_out = np.searchsorted(out_ends, begins, side='right')
+	paired = next_out < len(out_ends)
+	next_out = np.minimum(next_out, len(out_ends) - 1)
+	next_in = np.append(begins[1:], np.inf)
+	paired &= out_ends[next_out] <= next_in
+	return np.column_stack((begins[paired], out_ends[next_out[paired]] - begins[paired]))
+
+def get_capture_slices_index(capture):
+	# Index of the slices of each thread of the capture, built with the first query
+	if('slices_index' not in capture):
+		capture['slices_index'] = [build_intervals_index(get_thread_slices(thread)) for thread in capture['threads']]
+	return capture['slices_index']
+
+def is_thread_named(thread, name):
+	# The threads of a device can also be given as device:name when several devices are drawn together
+	return (thread['name'] == name or ('device' in thread and thread['device'] + ':' + thread['name'] == name))
+
+def get_query_slices(capture, thread_names, begin, end, ignored_threads = []):
+	# Returns the begins, the widths and the position in thread_names of the thread of the slices overlapping
+	# [begin, end] (the whole capture if None) of the threads named in thread_names, sorted by time
+	# thread_names = None takes every thread except the ones named in ignored_threads
+	begin 	= -np.inf if begin == None else begin
+	end 	= np.inf if end == None else end
+	begins = [np.empty(0)]
+	widths = [np.empty(0)]
+	owners = [np.empty(0, dtype=np.int64)]
+	for thread, index in zip(capture['threads'], get_capture_slices_index(capture)):
+		if(any(is_thread_named(thread, name) for name in ignored_threads)):
+			continue
+		for owner, name in enumerate([None] if thread_names == None else thread_names):
+			if(name == None or is_thread_named(thread, name)):
+				first, last = get_intervals_range(index, begin, end)
+				begins.append(index['begins'][first:last])
+				widths.append(index['widths'][first:last])
+				owners.append(np.full(last - first, owner, dtype=np.int64))
+	begins = np.concatenate(begins)
+	order = np.argsort(begins, kind='stable')
+	return begins[order], np.concatenate(widths)[order], np.concatenate(owners)[order]
+
+def query_long_slices(capture, thread_name, min_width, begin = None, end = None):
+	# Returns the slices of the thread longer than min_width ticks
+	begins, widths, owners = get_query_slices(capture, [thread_name], begin, end)
+	found = widths > min_width
+	return np.column_stack((begins[found], widths[found]))
+
+def query_gaps(capture, min_width, ignored_threads = [], begin = None, end = None):
+	# Returns the times longer than min_width ticks during which none of the threads ran,
+	# the threads named in ignored_threads (idle for example) not counting
+	# With several devices, the capture of one device should be given
+	begins, widths, owners = get_query_slices(capture, None, begin, end, ignored_threads)
+	# The slices can overlap when several threads are running (not logged threads)
+	ends = np.maximum.accumulate(begins + widths)
+	widths = begins[1:] - ends[:-1]
+	found = widths > min_width
+	return np.column_stack((ends[:-1][found], widths[found]))
+
+def query_alternations(capture, thread_a, thread_b, min_switches, max_gap = 0, begin = None, end = None):
+	# Returns the windows during which the two threads ran one after the other more than min_switches times,
+	# each slice beginning at most max_gap ticks after the end of the previous one (0 : switched directly)
+	begins, widths, owners = get_query_slices(capture, [thread_a, thread_b], begin, end)
+	ends = begins + widths
+	switches = (owners[1:] != owners[:-1]) & (begins[1:] - ends[:-1] <= max_gap + QUERY_TIME_TOLERANCE)
+	# Runs of consecutive switches, from the slice first to the slice last
+	edges = np.diff(np.concatenate(([0], switches.astype(np.int8), [0])))
+	first = np.flatnonzero(edges == 1)
+	last = np.flatnonzero(edges == -1)
+	found = (last - first) > min_switches
+	return np.column_stack((begins[first[found]], ends[last[found]] - begins[first[found]]))
+
+def build_events_index(capture, long_slice_width, ignored_threads = []):
+	# Sorted times of the events of the capture, to go from one to the other, see get_next_event()
+	# The ticks with several context switches are given by their middle and the slices longer
+	# than long_slice_width ticks by their beginning, the threads named in ignored_threads not counting
+	triggers = [device['capture']['trigger'] + device['offset'] for device in capture.get('devices', []) if device['capture']['trigger'] != None]
+	if(len(triggers) == 0 and capture['trigger'] != None):
+		triggers = [capture['trigger']]
+
+	exits = [thread['exit_value'][:, 0] for thread in capture['threads']]
+
+	# The records are sorted by time, so the records of a tick are contiguous
+	times = capture['records'][REC_TIME][capture['records'][REC_NB_OF_STEPS] > 1]
+	bursts = times[np.concatenate(([True], times[1:] != times[:-1]))] + 0.5 if len(times) > 0 else np.empty(0)
+
+	long_slices = [np.empty(0)]
+	for thread, index in zip(capture['threads'], get_capture_slices_index(capture)):
+		if(not any(is_thread_named(thread, name) for name in ignored_threads)):
+			long_slices.append(index['begins'][index['widths'] > long_slice_width])
+
+	return {'trigger': np.sort(np.array(triggers, dtype=np.float64)),
+			'exit': np.sort(np.concatenate([np.empty(0)] + exits)),
+			'burst': bursts.astype(np.float64),
+			'long_slice': np.sort(np.concatenate(long_slices))}
+
+def get_next_event(times, position, direction):
+	# Returns the first time of times after position (direction 1) or the last before it (direction -1), None if none
+	if(direction > 0):
+		index = np.searchsorted(times, position + QUERY_TIME_TOLERANCE, side='left')
+		return float(times[index]) if index < len(times) else None
+	index = np.searchsorted(times, position - QUERY_TIME_TOLERANCE, side='right') - 1
+	return float(times[index]) if index >= 0 else None
+
+def get_next_switch(index, position, direction):
+	# Returns the first beginning or end of the slices of a thread (index given by get_capture_slices_index())
+	# after position (direction 1) or the last before it (direction -1), None if none
+	switches = [time for time in (get_next_event(index['begins'], position, direction), get_next_event(index['ends'], position, direction)) if time != None]
+	if(len(switches) == 0):
+		return None
+	return min(switches) if direction > 0 else max(switches)
+
+def new_stream():
+	# State of a streaming acquisition. The timestamps of the successive dumps are stitched
+	# together and the threads of every dump are gathered into one list in creation order
+	return {'threads': [],			# every thread seen, in creation order
+			'alive': [],			# indexes in 'threads' of the not exited threads, the mcu numbering
+			'exits': [],			# (record index, position in 'alive', thread index) of each exit
+			'chunks': [],			# stitched records, by chunks to not copy them at each dump
+			'nb_records': 0,
+			'trigger': None,		# first trigger found in the dumps, in the time of the stitched records
+			'nb_dumps': 0,
+			'nb_gaps': 0}
+
+def get_stream_tail(stream, nb):
+	# Returns the last nb stitched records and the index of the first one
+	chunks = []
+	count = 0
+	for chunk in reversed(stream['chunks']):
+		chunks.insert(0, chunk)
+		count += len(chunk)
+		if(count >= nb):
+			break
+	if(len(chunks) == 0):
+		return np.empty(0, dtype=RECORDS_DTYPE), stream['nb_records']
+	tail = np.concatenate(chunks)[-nb:]
+	return tail, stream['nb_records'] - len(tail)
+
+def get_stream_records(stream):
+	if(len(stream['chunks']) == 0):
+		return np.empty(0, dtype=RECORDS_DTYPE)
+	return np.concatenate(stream['chunks'])
+
+def find_records_overlap(previous, new):
+	# The dumps are the content of the circular buffer of the mcu, so a new dump begins
+	# with the end of the previous one if the buffer hasn't been completely rewritten in between
+	# Returns the index in previous where new begins, None if there is no overlap
+	if(len(previous) == 0 or len(new) == 0):
+		return None
+
+	previous_time 	= previous[REC_TIME] % TIMESTAMPS_TIME_LOOP
+	new_time 		= new[REC_TIME] % TIMESTAMPS_TIME_LOOP
+
+	first_possible = max(0, len(previous) - len(new))
+	candidates = first_possible + np.flatnonzero(
+		(previous[REC_THREAD_OUT][first_possible:] == new[REC_THREAD_OUT][0])
+		& (previous[REC_THREAD_IN][first_possible:] == new[REC_THREAD_IN][0])
+		& (previous_time[first_possible:] == new_time[0]))
+
+	# The longest overlap is the most probable one
+	for begin in candidates.tolist():
+		length = len(previous) - begin
+		if(np.array_equal(previous[REC_THREAD_OUT][begin:], new[REC_THREAD_OUT][:length])
+			and np.array_equal(previous[REC_THREAD_IN][begin:], new[REC_THREAD_IN][:length])
+			and np.array_equal(previous_time[begin:], new_time[:length])):
+			return begin
+
+	return None
+
+def is_same_thread(stream_thread, dump_thread):
+	# The mcu forgets the name of a dynamic thread when it exits, so a thread exited between
+	# two dumps is listed by the new dump with EXITED_DYNAMIC_THREAD_NAME instead of its name
+	# A thread known only by its exit (see stitch_dump()) can be any exited thread
+	if(stream_thread['nb'] == 0):
+		return dump_thread['name'] == EXITED_DYNAMIC_THREAD_NAME
+	same_name = (stream_thread['name'] == dump_thread['name'] or dump_thread['name'] == EXITED_DYNAMIC_THREAD_NAME)
+	return (same_name and stream_thread['prio'] == dump_thread['prio'] and stream_thread['log'] == dump_thread['log'])
+
+def insert_exited_threads(threads, deleted_threads, exits_nb, known_exits, nb_late):
+	# Inserts the threads of the exits (numbers exits_nb, in the order of the records) back into threads
+	# The last nb_late exits happened after the threads list has been read, so their threads are still
+	# in threads. The others are paired with the deleted threads from the last ones
+	# The thread of an exit is None if unknown. Returns the number of pairs whose numbers differ
+	# and of threads supposed created after the list
+	nb_listed = len(threads)
+	nb_errors = 0
+	i = len(deleted_threads) - 1
+	for index in reversed(range(len(exits_nb) - nb_late)):
+		nb = exits_nb[index]
+		thread = known_exits.get(index)
+		if(i >= 0):
+			if(deleted_threads[i]['nb'] == nb):
+				thread = deleted_threads[i]
+			else:
+				nb_errors += 1
+			i -= 1
+		threads.insert(nb - 1, thread)
+	# A late exit numbered after the threads of the list can only be the one of a thread created
+	# after the list (a thread keeps at most its number of the list until it exits)
+	for nb in exits_nb[len(exits_nb) - nb_late:]:
+		if(nb > nb_listed):
+			threads.append(None)
+			nb_errors += 1
+	return nb_errors
+
+def rebuild_dump_threads(stream, alive_threads, deleted_threads, dump_records, first_index):
+	# Returns the threads of a dump in creation order, like process_threads_list_cmd() but
+	# following its exit records : the list of the deleted threads of the mcu isn't exact
+	# (a deleted thread isn't forgotten when its exit record is overwritten by another exit and
+	# an exit record found twice at the end of the buffer forgets two of them) and some exits
+	# can happen between the threads list and the timestamps
+	# The deleted threads are given in the order they have been deleted, so the last ones are the
+	# threads of the last exits. The threads of the other exits are given by the stream if the
+	# dump begins at its record first_index, unknown (None) otherwise
+	exits = get_records_exits(dump_records)
+	exits_nb = dump_records[REC_THREAD_OUT][exits].astype(np.int64).tolist()
+	known_exits = {}
+	if(first_index is not None):
+		exit_index = {record_index: i for i, record_index in enumerate(exits.tolist())}
+		for record_index, position, thread_index in reversed(stream['exits']):
+			if(record_index < first_index):
+				break
+			if(record_index - first_index in exit_index):
+				known_exits[exit_index[record_index - first_index]] = stream['threads'][thread_index]
+
+	# Keeps the number of late exits pairing the most exits with the deleted threads
+	best_threads = None
+	for nb_late in range(len(exits_nb) + 1):
+		threads = list(alive_threads)
+		nb_errors = insert_exited_threads(threads, deleted_threads, exits_nb, known_exits, nb_late)
+		if(best_threads is None or nb_errors < best_nb_errors):
+			best_threads, best_nb_errors = threads, nb_errors
+
+	return best_threads
+
+def match_dump_threads(stream, alive, dump_threads):
+	# Compares the threads alive (indexes in 'threads') with the threads of a dump, both in creation order
+	# Returns the positions in alive of the threads not found in the dump and the new threads,
+	# created after the known ones
+	missing = []
+	i = 0
+	for position, thread_index in enumerate(alive):
+		stream_thread = stream['threads'][thread_index]
+		if(i < len(dump_threads) and (dump_threads[i] is None or is_same_thread(stream_thread, dump_threads[i]))):
+			i += 1
+			continue
+		# Only the same name is searched further, an exited dynamic thread could be any of them
+		found = next((j for j in range(i + 1, len(dump_threads)) if dump_threads[j] is not None
+						and dump_threads[j]['name'] == stream_thread['name'] and is_same_thread(stream_thread, dump_threads[j])), None)
+		if(found is not None):
+			i = found + 1
+		else:
+			missing.append(position)
+
+	return missing, dump_threads[i:]
+
+def stitch_dump(stream, alive_threads, deleted_threads, dump_records, trigger = None):
+	# Adds the threads lists and the records of a new dump to the stream
+	# alive_threads and deleted_threads are given by process_threads_list_cmd()
+	# trigger is the trigger time of the dump given by parse_threads_timestamps_cmd()
+	# Returns the number of new records
+
+	missing = []
+	if(stream['nb_dumps'] == 0):
+		new_threads = rebuild_dump_threads(stream, alive_threads, deleted_threads, dump_records, None)
+		segment = dump_records
+		shift = 0
+	else:
+		tail, tail_index = get_stream_tail(stream, len(dump_records))
+		overlap_begin = find_records_overlap(tail, dump_records)
+
+		if(overlap_begin is not None):
+			# Only what follows the last stitched record is added
+			segment = dump_records[len(tail) - overlap_begin:]
+			# The times of the dump are unwrapped from its own beginning
+			shift = int(tail[overlap_begin][REC_TIME]) - int(dump_records[0][REC_TIME])
+
+			# The threads of the dump begin with the threads alive at the beginning of the dump
+			# (the ones alive now and the ones exited since). The others have been created after
+			# The stitched records give the exits of the known threads, so the ones not found are kept
+			overlap_begin += tail_index
+			alive = list(stream['alive'])
+			for record_index, position, thread_index in reversed(stream['exits']):
+				if(record_index < overlap_begin):
+					break
+				alive.insert(position, thread_index)
+			dump_threads = rebuild_dump_threads(stream, alive_threads, deleted_threads, dump_records, overlap_begin)
+			new_threads = match_dump_threads(stream, alive, dump_threads)[1]
+		else:
+			# The buffer of the mcu has been rewritten before we read it, some data are lost
+			# -> Finds the threads exited in the meantime by comparing the threads alive with the dump
+			stream['nb_gaps'] += 1
+			print('Stream : no overlap with the previous dump, some timestamps are lost')
+			segment = dump_records
+			dump_threads = rebuild_dump_threads(stream, alive_threads, deleted_threads, dump_records, None)
+			missing, new_threads = match_dump_threads(stream, stream['alive'], dump_threads)
+			# Places the dump after the last stitched record
+			last_time = int(tail[-1][REC_TIME])
+			shift = last_time - last_time % TIMESTAMPS_TIME_LOOP
+			if(int(dump_records[0][REC_TIME]) + shift < last_time):
+				shift += TIMESTAMPS_TIME_LOOP
+
+		segment = segment.copy()
+		segment[REC_TIME] += shift
+
+	# The trigger stays the same in the next dumps until the logs are run again, 
+	# only the first one is kept like when the captures of several devices are merged
+	if(trigger != None and stream['trigger'] == None):
+		stream['trigger'] = trigger + shift
+
+	# The new threads are always created after the known ones
+	for thread in new_threads:
+		if(thread is None):
+			# Exit of a thread missing from the list of the deleted threads
+			unknown = []
+			append_thread(unknown, EXITED_DYNAMIC_THREAD_NAME, 0, 0, 'Yes')
+			thread = unknown[0]
+		stream['alive'].append(len(stream['threads']))
+		stream['threads'].append(thread)
+
+	# Writes an exit for each thread lost in the data gap, at the beginning of the dump
+	if(len(missing) > 0 and len(segment) > 0):
+		exits = np.zeros(len(missing), dtype=RECORDS_DTYPE)
+		# From the end to keep the positions of the others valid
+		exits[REC_THREAD_OUT] 	= [position + 1 for position in reversed(missing)]
+		exits[REC_THREAD_IN] 	= exits[REC_THREAD_OUT]
+		exits[REC_TIME] 		= segment[0][REC_TIME]
+		segment = np.concatenate((exits, segment))
+
+	# Follows the deletions to keep the numbering of the threads
+	first_index = stream['nb_records']
+	thread_out = segment[REC_THREAD_OUT]
+	for i in np.flatnonzero(thread_out == segment[REC_THREAD_IN]).tolist():
+		position = int(thread_out[i]) - 1
+		if(0 <= position < len(stream['alive'])):
+			stream['exits'].append((first_index + i, position, stream['alive'].pop(position)))
+
+	if(len(segment) > 0):
+		stream['chunks'].append(segment)
+		stream['nb_records'] += len(segment)
+	stream['nb_dumps'] += 1
+
+	return len(segment)
+
+def get_stream_lines(stream):
+	# Writes the stream as the answers of the Shell, as if the mcu had an infinite buffer
+	# The alive threads are numbered by their position, the exited ones by their position
+	# at the time they were exited
+	lines_list = ['threads_list']
+	for position, thread_index in enumerate(stream['alive']):
+		thread = stream['threads'][thread_index]
+		lines_list.append('Thread number {:2d} : Prio = {:3d}, Log = {:>3s}, Name = {}'.format(position + 1, 
+							thread['prio'], 'Yes' if thread['log'] else 'No', thread['name']))
+	lines_list.append('Deleted threads: ')
+	for record_index, position, thread_index in stream['exits']:
+		thread = stream['threads'][thread_index]
+		lines_list.append('Thread number {:2d} : Prio = {:3d}, Log = {:>3s}, Name = {}'.format(position + 1, 
+							thread['prio'], 'Yes' if thread['log'] else 'No', thread['name']))
+	lines_list.append('ch> ')
+
+	records = get_stream_records(stream)
+	lines_data = records_to_timestamps_lines(records, stream['trigger'])
+
+	return lines_list, lines_data, records
+
+def stream_device_dump(device):
+	# Reads a new dump of the device and stitches it to its stream
+	stream = device['stream']
+	flush_shell(device)
+
+	set_serial_status('Streaming : threads list')
+	send_command(device, 'threads_list', False)
+	lines_list = receive_text(device, False)
+	alive_threads = []
+	deleted_threads = []
+	if(process_threads_list_cmd(lines_list, alive_threads, deleted_threads) == FUNC_FAILED):
+		return FUNC_FAILED
+
+	set_serial_status('Streaming : dump {}'.format(stream['nb_dumps'] + 1))
+	send_command(device, 'threads_timestamps', False)
+	lines_data, parsed_records = receive_timestamps(device)
+	trigger, dump_records, result = parse_threads_timestamps_cmd(lines_data, parsed_records)
+	if(result == FUNC_FAILED):
+		return FUNC_FAILED
+
+	nb_new = stitch_dump(stream, alive_threads, deleted_threads, dump_records, trigger)
+	prefix = ''
+	if(len(devices) > 1):
+		prefix = ' ' + get_device_label(device)
+	print('Stream{} : dump {}, {} new timestamps, {} in total'.format(prefix, stream['nb_dumps'], nb_new, stream['nb_records']))
+	return FUNC_SUCCESS
+
+def build_stream_capture(device):
+	# Returns the capture of what has been stitched, None if nothing
+	stream = device['stream']
+	if(stream['nb_records'] == 0):
+		return None
+	lines_list, lines_data, stitched_records = get_stream_lines(stream)
+	capture = build_capture(lines_list, lines_data, stitched_records)
+	# The trigger line only gives the time modulo 2^20, which is ambiguous if the stream 
+	# lasts longer than that
+	if(capture != None):
+		capture['trigger'] = stream['trigger']
+	return capture
+
+def set_serial_status(status):
+	global serial_status
+	serial_status = status
+
+def acquire_device_capture(device):
+	# The answers are only printed if there is one device, otherwise they would be mixed
+	echo = (len(devices) == 1)
+	flush_shell(device)
+
+	# Sends command "threads_list"
+	set_serial_status('Getting the threads list')
+	send_command(device, 'threads_list', echo)
+	lines_list = receive_text(device, echo)
+
+	# Sends command "threads_timestamps"
+	set_serial_status('Receiving the timestamps')
+	send_command(device, 'threads_timestamps', echo)
+	lines_data, parsed_records = receive_timestamps(device)
+
+	set_serial_status('Processing the timestamps')
+	return build_capture(lines_list, lines_data, parsed_records)
+
+def get_thread_prio(thread):
+	return thread['prio']
+
+def sort_threads_by_prio(thread_list):
+	thread_list.sort(key=get_thread_prio)
+
+def split_file_name_extension(file_path):
+	# Splits the name and the extension of the file
+	# Only the extensions of the captures can have several dots, the other dots belong to the name
+	# (port names such as cu.usbmodem1411 in the names of the files of several devices)
+	for extension in CAPTURE_EXTENSIONS:
+		if(file_path.endswith(extension)):
+			return file_path[:-len(extension)], extension
+	return os.path.splitext(file_path)
+
+def get_file_label(label):
+	# Label usable in a file name, the dots would be taken for an extension
+	return ''.join(character if (character.isalnum() or character in '-_') else '_' for character in label)
+
+def open_txt_capture(file_path, mode):
+	# The txt files can also be compressed with gzip
+	if(file_path.endswith(CAPTURE_TXT_GZ_EXTENSION)):
+		return gzip.open(file_path, mode)
+	return open(file_path, mode)
+
+def write_txt_capture(file_path, lines_pos, lines_list, lines_data):
+	# Opens the file as Write Text
+	file = open_txt_capture(file_path,'wt')
+
+	# Writes the position in the graph
+	file.write('Saved position\n')
+	file.write(str(lines_pos[0]) + '\n' + str(lines_pos[1]) + '\n' + str(lines_pos[2]) + '\n' + str(lines_pos[3]) + '\n')
+
+	# Writes the lines to the file
+	for line in lines_list:
+		file.write(line + '\n')
+	for line in lines_data:
+		file.write(line + '\n')
+
+	file.close()
+
+def write_binary_capture(file_path, lines_pos, lines_list, records, trigger):
+	header = {'version': CAPTURE_BINARY_VERSION, 'threads_list': lines_list, 
+			  'trigger': None if trigger == None else int(trigger),
+			  'position': [float(value) for value in lines_pos],
+			  'nb_records': len(records), 'columns': []}
+
+	# The offsets of the columns are counted from the end of the header
+	offset = 0
+	for name, dtype in CAPTURE_BINARY_COLUMNS:
+		header['columns'].append({'name': name, 'dtype': dtype, 'offset': offset})
+		offset += len(records) * np.dtype(dtype).itemsize
+		offset += -offset % CAPTURE_BINARY_ALIGNMENT
+
+	header_text = json.dumps(header).encode('utf-8')
+	header_size = len(CAPTURE_BINARY_MAGIC) + 4 + len(header_text)
+	header_text += b' ' * (-header_size % CAPTURE_BINARY_ALIGNMENT)
+
+	file = open(file_path, 'wb')
+	file.write(CAPTURE_BINARY_MAGIC)
+	file.write(struct.pack('<I', len(header_text)))
+	file.write(header_text)
+	for name, dtype in CAPTURE_BINARY_COLUMNS:
+		column = np.ascontiguousarray(records[name], dtype=dtype)
+		file.write(column.tobytes())
+		file.write(b'\0' * (-column.nbytes % CAPTURE_BINARY_ALIGNMENT))
+	file.close()
+
+def read_binary_header(file):
+	# Returns the header of a binary capture and the offset of its columns
+	# or None, 0 if the file is not valid
+	magic = file.read(len(CAPTURE_BINARY_MAGIC))
+	header_size = file.read(4)
+	if(magic != CAPTURE_BINARY_MAGIC or len(header_size) != 4):
+		return None, 0
+	header_size = struct.unpack('<I', header_size)[0]
+	try:
+		header = json.loads(file.read(header_size).decode('utf-8'))
+	except ValueError:
+		return None, 0
+
+	if(header.get('version') != CAPTURE_BINARY_VERSION or header['nb_records'] == 0):
+		return None, 0
+
+	return header, len(CAPTURE_BINARY_MAGIC) + 4 + header_size
+
+def is_binary_capture_complete(header, data_offset, file_size):
+	# The sizes given by the header of a truncated or corrupted file go past its end
+	columns = dict(CAPTURE_BINARY_COLUMNS)
+	for column in header['columns']:
+		if(column['name'] not in columns or np.dtype(column['dtype']) != np.dtype(columns[column['name']])):
+			return False
+		if(data_offset + column['offset'] + header['nb_records'] * np.dtype(column['dtype']).itemsize > file_size):
+			return False
+	return True
+
+def read_binary_capture(file_path):
+	# Returns the saved position, the threads_list lines, the trigger time and the records
+	# or None if the file is not valid
+	# The columns are stored as the arrays of the records, they are copied into the records
+	# without being parsed
+	try:
+		file = open(file_path, 'rb')
+	except:
+		print("File doesn't exist")
+		return None
+
+	print('Loading file ',file_path)
+	header, data_offset = read_binary_header(file)
+	file.close()
+	if(header == None or not is_binary_capture_complete(header, data_offset, os.path.getsize(file_path))):
+		print('File not recognized')
+		return None
+
+	capture_records = np.zeros(header['nb_records'], dtype=RECORDS_DTYPE)
+	for column in header['columns']:
+		capture_records[column['name']] = np.memmap(file_path, dtype=column['dtype'], mode='r', 
+									offset=data_offset + column['offset'], shape=(header['nb_records'],))
+
+	return header['position'], header['threads_list'], header['trigger'], capture_records
+
+def write_capture_file(file_path, lines_pos, lines_list, lines_data, records, trigger):
+	# The format is given by the extension of the file
+	if(file_path.endswith(CAPTURE_BINARY_EXTENSION)):
+		write_binary_capture(file_path, lines_pos, lines_list, records, trigger)
+	else:
+		# Captures loaded from a binary file have no timestamps lines
+		if(len(lines_data) == 0):
+			lines_data = records_to_timestamps_lines(records, trigger)
+		write_txt_capture(file_path, lines_pos, lines_list, lines_data)
+
+def read_capture_file(file_path):
+	# Returns the capture saved in the file or None if it is not valid
+	# The capture is taken from the cache if the file has already been opened
+	cache_key, lines_pos = get_capture_file_cache_key(file_path)
+	if(cache_key != None):
+		capture = read_cached_capture(cache_key, lines_pos)
+		if(capture != None):
+			print('File loaded from the cache')
+			return capture
+
+	if(file_path.endswith(CAPTURE_BINARY_EXTENSION)):
+		content = read_binary_capture(file_path)
+	else:
+		content = read_txt_capture(file_path)
+	if(content == None):
+		return None
+
+	lines_pos, lines_list, trigger, capture_records = content
+	capture = build_capture_from_records(lines_list, capture_records, trigger, lines_pos)
+	if(capture != None):
+		print('File loaded')
+		if(cache_key != None):
+			write_cached_capture(cache_key, capture)
+	return capture
+
+def get_default_cache_dir():
+	# Folder where the processed captures are kept between two launches of the script
+	if(sys.platform == 'win32'):
+		base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+	else:
+		base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+	return os.path.join(base, 'threads_timeline')
+
+def get_capture_file_cache_key(file_path):
+	# Returns the key of the capture saved in the file and the saved position
+	# or None, None if the cache is disabled or the file can't be read
+	# The key is the hash of the answers of the Shell saved in the file, so it doesn't depend
+	# on the saved position or on the name of the file. The file is read without being parsed
+	if(capture_cache_dir == None):
+		return None, None
+
+	file_hash = hashlib.sha256(str(CAPTURE_CACHE_VERSION).encode('utf-8'))
+	try:
+		if(file_path.endswith(CAPTURE_BINARY_EXTENSION)):
+			file_hash.update(CAPTURE_BINARY_EXTENSION.encode('utf-8'))
+			with open(file_path, 'rb') as file:
+				header, data_offset = read_binary_header(file)
+				if(header == None):
+					return None, None
+				file_hash.update(json.dumps([header['threads_list'], header['trigger'], header['nb_records'], header['columns']]).encode('utf-8'))
+				file.seek(data_offset)
+				for block in iter(lambda: file.read(CAPTURE_TXT_READ_SIZE), b''):
+					file_hash.update(block)
+			return file_hash.hexdigest(), header['position']
+
+		# The answers begin with threads_list, the saved position is before
+		file_hash.update(CAPTURE_TXT_EXTENSION.encode('utf-8'))
+		with open_txt_capture(file_path, 'rb') as file:
+			block = file.read(CAPTURE_TXT_READ_SIZE)
+			begin = block.find(b'threads_list')
+			if(begin < 0):
+				return None, None
+			lines = block[:begin].decode('utf-8').splitlines()
+			lines = list(filter(None, lines))
+			if(len(lines) == 0 or lines[0].find('Saved position') == -1):
+				return None, None
+			lines_pos = lines[1:]
+			file_hash.update(block[begin:])
+			for block in iter(lambda: file.read(CAPTURE_TXT_READ_SIZE), b''):
+				file_hash.update(block)
+		return file_hash.hexdigest(), lines_pos
+	except (OSError, EOFError, UnicodeDecodeError):
+		return None, None
+
+def get_cached_capture_path(cache_key):
+	return os.path.join(capture_cache_dir, cache_key + CAPTURE_CACHE_EXTENSION)
+
+def write_cached_capture(cache_key, capture):
+	# The arrays of the threads are saved next to the records, the rest is saved as JSON
+	arrays = {'records': capture['records']}
+	threads_fields = []
+	for i, thread in enumerate(capture['threads']):
+		fields = {}
+		for key, value in thread.items():
+			if(isinstance(value, np.ndarray)):
+				arrays['thread_{}_{}'.format(i, key)] = value
+			else:
+				fields[key] = value
+		threads_fields.append(fields)
+	header = {'version': CAPTURE_CACHE_VERSION, 'threads': threads_fields, 'lines_list': capture['lines_list'],
+			  'trigger': None if capture['trigger'] == None else int(capture['trigger'])}
+	arrays['header'] = np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8)
+
+	# Written under another name first, so an interrupted writing never leaves a bad capture in the cache
+	# The name is unique so several processes can cache the same capture at the same time
+	cache_path = get_cached_capture_path(cache_key)
+	temp_path = None
+	try:
+		os.makedirs(capture_cache_dir, exist_ok=True)
+		with tempfile.NamedTemporaryFile(dir=capture_cache_dir, suffix='.tmp', delete=False) as file:
+			temp_path = file.name
+			np.savez(file, **arrays)
+		os.replace(temp_path, cache_path)
+	except OSError as error:
+		print('Capture not cached:', error)
+		if(temp_path != None and os.path.exists(temp_path)):
+			try:
+				os.remove(temp_path)
+			except OSError:
+				pass
+		return
+
+	remove_least_recently_used_captures()
+
+def read_cached_capture(cache_key, lines_pos):
+	# Returns the capture from the cache or None if it isn't there
+	cache_path = get_cached_capture_path(cache_key)
+	if(not os.path.exists(cache_path)):
+		return None
+
+	try:
+		with np.load(cache_path, allow_pickle=False) as arrays:
+			header = json.loads(arrays['header'].tobytes().decode('utf-8'))
+			if(header['version'] != CAPTURE_CACHE_VERSION):
+				return None
+			capture_threads = []
+			for i, fields in enumerate(header['threads']):
+				thread = dict(fields)
+				prefix = 'thread_{}_'.format(i)
+				for name in arrays.files:
+					if(name.startswith(prefix)):
+						thread[name[len(prefix):]] = arrays[name]
+				capture_threads.append(thread)
+			capture_records = arrays['records']
+		# Most recently used
+		os.utime(cache_path)
+	except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as error:
+		# Removed so the file is parsed and cached again
+		print('Bad capture in the cache:', error)
+		try:
+			os.remove(cache_path)
+		except OSError:
+			pass
+		return None
+
+	return make_capture(capture_threads, capture_records, header['trigger'], header['lines_list'], [], lines_pos)
+
+def remove_least_recently_used_captures():
+	# Removes the captures used the longest time ago until the cache is smaller than CAPTURE_CACHE_MAX_SIZE
+	# (the last one written is always kept)
+	# The last modification time of a capture is updated each time it is read
+	try:
+		cached = []
+		for name in os.listdir(capture_cache_dir):
+			if(name.endswith(CAPTURE_CACHE_EXTENSION)):
+				cache_stat = os.stat(os.path.join(capture_cache_dir, name))
+				cached.append((cache_stat.st_mtime, cache_stat.st_size, name))
+		cached.sort()
+		cache_size = sum(size for mtime, size, name in cached)
+		while(cache_size > CAPTURE_CACHE_MAX_SIZE and len(cached) > 1):
+			mtime, size, name = cached.pop(0)
+			os.remove(os.path.join(capture_cache_dir, name))
+			cache_size -= size
+	except OSError as error:
+		print('Cache not cleaned:', error)
+
+def convert_capture_file(source_path, destination_path):
+	# Converts a saved capture between the txt and binary formats
+	capture = read_capture_file(source_path)
+	if(capture == None):
+		print('Conversion failed')
+		return FUNC_FAILED
+
+	write_capture_file(destination_path, capture['lines_pos'], capture['lines_list'], 
+						capture['lines_data'], capture['records'], capture['trigger'])
+	print(destination_path, 'Saved !')
+	return FUNC_SUCCESS
+
+def read_txt_capture(file_path):
+	# Returns the saved position, the threads_list lines, the trigger time and the records
+	# or None if the file is not valid
+	# The file is read by blocks and the timestamps lines are parsed as soon as they are read,
+	# so only the records are kept in memory
+	try:
+		# Opens the file as Read Text
+		file = open_txt_capture(file_path, 'rt')
+	except OSError:
+		print("File doesn't exist")
+		return None
+
+	print('Loading file ',file_path)
+
+	# The file contains in this order (empty lines are ignored) :
+	# Saved position, then the 4 values of the position
+	# The answer of threads_list
+	# The answer of threads_timestamps
+	section 		= None
+	lines_pos 		= []
+	lines_list 		= []
+	lines_data 		= []
+	header_done 	= False
+	first_line 		= None
+	pending_lines 	= []
+	records_batches = []
+	corrupted 		= False
+	end_of_file 	= False
+	remaining 		= ''
+
+	try:
+		while(not end_of_file):
+			text = file.read(CAPTURE_TXT_READ_SIZE)
+			end_of_file = (len(text) == 0)
+			lines = (remaining + text).split('\n')
+			# The last line may be incomplete, it is completed by the next read
+			if(not end_of_file):
+				remaining = lines.pop()
+			# Removes empty lines
+			lines = list(filter(None, lines))
+
+			i = 0
+			while(section != 'data' and i < len(lines)):
+				line = lines[i]
+				i += 1
+				# Searches for the beginning of the Saved position fields
+				if(section == None):
+					if(line.find('Saved position') != -1):
+						section = 'pos'
+				# Searches for the beginning of the thread_list fields
+				elif(line.find('threads_list') != -1):
+					section = 'list'
+					lines_list.append(line)
+				# Searches for the beginning of the threads_timestamps fields
+				elif(section == 'list' and line.find('threads_timestamps') != -1):
+					section = 'data'
+					lines_data.append(line)
+				elif(section == 'pos'):
+					lines_pos.append(line)
+				else:
+					lines_list.append(line)
+
+			if(section != 'data'):
+				continue
+
+			# Keeps the header of the answer (one more line if the trigger mode is enabled,
+			# see process_threads_timestamps_cmd()) and the first timestamp line to check the answer
+			if(not header_done and i < len(lines)):
+				if(lines[i][:len('Triggered at ')] == 'Triggered at '):
+					lines_data.append(lines[i])
+					i += 1
+				header_done = True
+			if(first_line == None and i < len(lines)):
+				first_line = lines[i]
+
+			# The last line read could be the prompt, so it is kept for later
+			pending_lines += lines[i:]
+			if(len(pending_lines) > 1):
+				if(not corrupted):
+					batch = parse_timestamps_lines(pending_lines[:-1])
+					if(batch is None):
+						corrupted = True
+					else:
+						records_batches.append(batch)
+				pending_lines = pending_lines[-1:]
+	except (OSError, EOFError, UnicodeDecodeError):
+		print('Error while reading the file')
+		corrupted = True
+	file.close()
+
+	# Tests if we found all the fields and if the file ends with ch>
+	if(section != 'data' or len(pending_lines) == 0 or pending_lines[-1] != 'ch> '):
+		print('File not recognized')
+		return None
+
+	if(corrupted):
+		print('Bad answer received, some timestamps lines are corrupted')
+		return None
+
+	# The answer is checked with only its first timestamp line, the others being already parsed
+	lines_data += [first_line, 'ch> ']
+	if(len(records_batches) > 0):
+		capture_records = np.concatenate(records_batches)
+	else:
+		capture_records = np.zeros(0, dtype=RECORDS_DTYPE)
+	trigger, capture_records, result = parse_threads_timestamps_cmd(lines_data, capture_records)
+	if(result == FUNC_FAILED):
+		return None
+
+	return lines_pos, lines_list, trigger, capture_records